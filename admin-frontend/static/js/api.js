@@ -12,3 +12,33 @@ async function fetchInventory() {
     const response = await fetch(`${API_BASE_URL}/inventory`);
     return await response.json();
 }
+
+// Newest-first sales history, one keyset page per call of the returned
+// loadPage(). The button stays visible while older pages remain and, when
+// clicked, passes the next page to appendRows.
+function pageSalesHistory(loadMoreBtn, appendRows, pageSize = 100) {
+    let nextCursor = null;
+
+    async function loadPage() {
+        const params = new URLSearchParams({ limit: pageSize, order: 'desc' });
+        if (nextCursor) params.set('before_id', nextCursor);
+        const response = await fetch(`${API_BASE_URL}/sales/history?${params}`);
+        const page = await response.json();
+        nextCursor = page.next_cursor;
+        loadMoreBtn.classList.toggle('hidden', !nextCursor);
+        return Array.isArray(page.sales) ? page.sales : [];
+    }
+
+    loadMoreBtn.addEventListener('click', async () => {
+        loadMoreBtn.disabled = true;
+        try {
+            appendRows(await loadPage());
+        } catch (err) {
+            console.error('Error fetching sales:', err);
+        } finally {
+            loadMoreBtn.disabled = false;
+        }
+    });
+
+    return loadPage;
+}
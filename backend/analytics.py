@@ -0,0 +1,427 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # optional, only needed for ANALYTICS_BACKEND = "numpy"
+    np = None
+
+import db
+
+# Dashboard numbers for /api/admin/analytics. build_dashboard() only asks a
+# source for revenue buckets, so the same code renders from:
+#   RollupSource     the sales_rollup tables (the live path)
+#   SalesScan        raw sales folded in one pass: each order touches its hour
+#                    and its categories once, and day, ISO week and month are
+#                    summed from the hours, parsing each calendar day once
+#   ColumnarSource   NumPy columns topped up with new sales (optional)
+# Keys match the rollups: 'YYYY-MM-DD HH', 'YYYY-MM-DD', the week's Monday as
+# 'YYYY-MM-DD', and 'YYYY-MM', all in local time.
+
+UNCATEGORISED = "Other"  # donut label for sale lines without a category
+
+def _empty_bucket():
+    return {"amount": 0, "orders": 0, "items": 0}
+
+class RollupSource:
+    """Buckets read from the sales_rollup tables maintained by record_sale."""
+
+    def buckets(self, period, first, last):
+        if period != 'week':
+            return db.get_rollup(period, first, last)
+        # Weeks are not rolled up; fold the days (at most 7 per week)
+        last_day = (datetime.strptime(last, "%Y-%m-%d") + timedelta(days=6)).strftime("%Y-%m-%d")
+        weeks = {}
+        for day_str, totals in db.get_rollup('day', first, last_day).items():
+            day = datetime.strptime(day_str, "%Y-%m-%d")
+            week = weeks.setdefault((day - timedelta(days=day.weekday())).strftime("%Y-%m-%d"), _empty_bucket())
+            for key in week:
+                week[key] += totals[key]
+        return weeks
+
+    def category_totals(self):
+        return db.get_category_totals()
+
+    def top_products(self, limit=20, start=None, end=None):
+        return db.get_top_products(limit, start, end)
+
+class SalesScan:
+    """Buckets folded from raw sales in a single pass (e.g. over db.iter_sales())."""
+
+    def __init__(self, sales=()):
+        self._hours = {}  # timestamp[:13] ('YYYY-MM-DDTHH') -> [amount, orders, items]
+        self._categories = {}
+        self._derived = None
+        self.orders = 0
+        for sale in sales:
+            self.add(sale)
+
+    def add(self, sale):
+        item_count = 0
+        categories = self._categories
+        for item in sale['items']:  # sale_items rows always carry these keys
+            qty = item['qty']
+            item_count += qty
+            cat = item['category'] or ''
+            categories[cat] = categories.get(cat, 0) + item['final_price'] * qty
+        # Only the hour is touched per order; coarser buckets are summed from hours
+        hour = sale['timestamp'][:13]
+        bucket = self._hours.get(hour)
+        if bucket is None:
+            bucket = self._hours[hour] = [0, 0, 0]
+        bucket[0] += sale['total']
+        bucket[1] += 1
+        bucket[2] += item_count
+        self.orders += 1
+        self._derived = None
+
+    def _periods(self):
+        if self._derived is None:
+            derived = {'hour': {}, 'day': {}, 'week': {}, 'month': {}}
+            weeks = {}  # day -> Monday; each calendar day is parsed once
+            for hour, (amount, orders, items) in sorted(self._hours.items()):
+                day = hour[:10]
+                if day not in weeks:
+                    date = datetime.fromisoformat(day).date()
+                    weeks[day] = (date - timedelta(days=date.weekday())).isoformat()
+                for period, key in (('hour', f"{day} {hour[11:13]}"), ('day', day),
+                                    ('week', weeks[day]), ('month', day[:7])):
+                    bucket = derived[period].get(key)
+                    if bucket is None:
+                        bucket = derived[period][key] = _empty_bucket()
+                    bucket["amount"] += amount
+                    bucket["orders"] += orders
+                    bucket["items"] += items
+            self._derived = derived
+        return self._derived
+
+    def buckets(self, period, first, last):
+        return {k: dict(v) for k, v in self._periods()[period].items() if first <= k <= last}
+
+    def category_totals(self):
+        return dict(sorted(self._categories.items()))
+
+class _Column:
+    """Append-only NumPy array with spare capacity, doubled when full."""
+
+    def __init__(self, dtype=float):
+        self._data = np.empty(1024, dtype)
+        self._size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, self._data.dtype)
+        end = self._size + len(values)
+        if end > len(self._data):
+            grown = np.empty(max(end, 2 * len(self._data)), self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        # Only the slots past the old size are written, so earlier views stay valid
+        self._data[self._size:end] = values
+        self._size = end
+
+    def replace(self, values):
+        """Swap in reordered contents (a fresh buffer, so readers of the old one are unaffected)."""
+        data = np.empty(len(self._data), self._data.dtype)
+        data[:len(values)] = values
+        self._data = data
+
+    def view(self):
+        return self._data[:self._size]
+
+class ColumnarSource:
+    """
+    Sales held as NumPy columns (config.ANALYTICS_BACKEND = "numpy"). Every
+    query first appends the sales added since the last one, then slices the
+    time range and buckets it with searchsorted over local-time bucket edges
+    and bincount. Columns grow in place with amortised doubling, so a
+    checkout costs only its own rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._categories, self._category_codes = [], {}
+        self._products, self._product_codes = [], {}  # grouping key: product id, else line name
+        self._product_ids, self._product_names = [], []  # per code; name from the newest sale line
+        self._cols = {
+            "ts": _Column(), "total": _Column(), "items": _Column(),                # one per sale
+            "category": _Column(np.int64), "product": _Column(np.int64),           # one per line
+            "line_ts": _Column(), "qty": _Column(), "revenue": _Column(),
+        }
+
+    def _code(self, value, values, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def refresh(self):
+        """Append sales committed since the last refresh; returns views of the current columns."""
+        with self._lock:
+            self._refresh()
+            return self._views()
+
+    def _views(self):
+        return {name: col.view() for name, col in self._cols.items()}
+
+    def _refresh(self):
+        sales, lines = db.get_sale_columns(self._last_id)
+        if not sales:
+            return
+        ids = np.array([s[0] for s in sales], np.int64)
+        ts = np.array([s[1] for s in sales], float)
+        line_sale = np.searchsorted(ids, np.array([l[0] for l in lines], np.int64))
+        qty = np.array([l[4] for l in lines], float)
+        products = []
+        for l in lines:
+            code = self._code(l[2] if l[2] is not None else l[3], self._products, self._product_codes)
+            if code == len(self._product_names):
+                self._product_ids.append(l[2])
+                self._product_names.append(l[3])
+            elif l[3] is not None:
+                self._product_names[code] = l[3]
+            products.append(code)
+        cols = self._cols
+        prev_ts = cols["ts"].view()
+        in_order = bool(np.all(np.diff(ts) >= 0)) and (not len(prev_ts) or ts[0] >= prev_ts[-1])
+        cols["ts"].extend(ts)
+        cols["total"].extend([s[2] for s in sales])
+        cols["items"].extend(np.bincount(line_sale, weights=qty, minlength=len(ids)))
+        cols["category"].extend([self._code(l[1] or '', self._categories, self._category_codes) for l in lines])
+        cols["product"].extend(products)
+        cols["line_ts"].extend(ts[line_sale])
+        cols["qty"].extend(qty)
+        cols["revenue"].extend(np.array([l[5] for l in lines], float) * qty)
+        if not in_order:
+            # Back-dated sales (imports, restores): keep the per-sale columns in time order
+            order = np.argsort(cols["ts"].view(), kind='stable')
+            for name in ("ts", "total", "items"):
+                cols[name].replace(cols[name].view()[order])
+        self._last_id = sales[-1][0]
+
+    def buckets(self, period, first, last):
+        cols = self.refresh()
+        keys, starts = _bucket_starts(period, first, last)
+        edges = np.array([d.timestamp() for d in starts])
+        # The per-sale columns are in time order, so the range is a slice
+        lo, hi = np.searchsorted(cols["ts"], [edges[0], edges[-1]])
+        idx = np.searchsorted(edges, cols["ts"][lo:hi], side='right') - 1
+        orders = np.bincount(idx, minlength=len(keys))
+        amount = np.bincount(idx, weights=cols["total"][lo:hi], minlength=len(keys))
+        item_counts = np.bincount(idx, weights=cols["items"][lo:hi], minlength=len(keys))
+        return {key: {"amount": float(amount[i]), "orders": int(orders[i]), "items": int(item_counts[i])}
+                for i, key in enumerate(keys) if orders[i]}
+
+    def category_totals(self):
+        with self._lock:
+            self._refresh()
+            cols = self._views()
+            category_codes = dict(self._category_codes)
+        size = len(category_codes)
+        lines = np.bincount(cols["category"], minlength=size)
+        amount = np.bincount(cols["category"], weights=cols["revenue"], minlength=size)
+        return {cat: float(amount[code]) for cat, code in sorted(category_codes.items()) if lines[code]}
+
+    def top_products(self, limit=20, start=None, end=None):
+        """Same rows as db.get_top_products(); start/end are datetimes."""
+        with self._lock:
+            self._refresh()
+            cols = self._views()
+            product_ids, product_names = list(self._product_ids), list(self._product_names)
+        product, revenue, qty = cols["product"], cols["revenue"], cols["qty"]
+        if start is not None or end is not None:
+            # Lines are in sale id order, not time order, so mask rather than slice
+            mask = np.ones(len(product), bool)
+            if start is not None:
+                mask &= cols["line_ts"] >= start.timestamp()
+            if end is not None:
+                mask &= cols["line_ts"] < end.timestamp()
+            product, revenue, qty = product[mask], revenue[mask], qty[mask]
+        size = len(product_ids)
+        revenue = np.bincount(product, weights=revenue, minlength=size)
+        quantity = np.bincount(product, weights=qty, minlength=size)
+        lines = np.bincount(product, minlength=size)
+        top = []
+        for code in [code for code in np.argsort(-revenue, kind='stable') if lines[code]][:limit]:
+            pid, name = product_ids[code], product_names[code]
+            catalog_product = db.get_product(pid) if pid else None
+            top.append({"id": pid, "name": (catalog_product or {}).get('name') or name or 'Unknown',
+                        "quantity": int(quantity[code]), "revenue": round(float(revenue[code]), 2)})
+        return top
+
+BUCKET_STEPS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+
+def _bucket_starts(period, first, last):
+    """Keys of the buckets from first to last and their local start times, plus the end of the last one."""
+    fmt = {'hour': "%Y-%m-%d %H", 'day': "%Y-%m-%d", 'week': "%Y-%m-%d", 'month': "%Y-%m"}[period]
+    start = datetime.strptime(first, fmt)
+    end = datetime.strptime(last, fmt)
+    keys, starts = [], []
+    while start <= end:
+        keys.append(start.strftime(fmt))
+        starts.append(start)
+        if period == 'month':
+            start = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        else:
+            start += BUCKET_STEPS[period]
+    starts.append(start)
+    return keys, starts
+
+def get_source(backend):
+    """The bucket source for config.ANALYTICS_BACKEND: "rollup" (default) or "numpy"."""
+    if backend == "numpy":
+        if np is not None:
+            return ColumnarSource()
+        print("ANALYTICS_BACKEND is numpy but NumPy is not installed; using the sales rollups")
+    return RollupSource()
+
+class ResultCache:
+    """
+    Computed reports keyed by endpoint and parameters. An entry is served while
+    the version it was computed at (e.g. db.sales_version()) is still current; the
+    least recently used entries are dropped past max_entries.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, compute):
+        """The cached value for key if still at version, else compute() (stored under version)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "entries": len(self._entries)
+            }
+
+def build_dashboard(source, now, end_dt):
+    """
+    Today's totals and the chart series of the admin dashboard. end_dt is the
+    last day of the 7-day chart (the calendar pick, never after now).
+    """
+    today_start = datetime(now.year, now.month, now.day)
+    yesterday_start = today_start - timedelta(days=1)
+    today_str = today_start.strftime("%Y-%m-%d")
+    yesterday_str = yesterday_start.strftime("%Y-%m-%d")
+
+    # 1. Today's Stats (Strictly Correct Data)
+    recent_days = source.buckets('day', yesterday_str, today_str)
+    today_sales = recent_days.get(today_str, {}).get('amount', 0)
+    today_orders_count = recent_days.get(today_str, {}).get('orders', 0)
+
+    # Calculate trend (vs Yesterday)
+    yesterday_sales = recent_days.get(yesterday_str, {}).get('amount', 0)
+    trend_pct = 0
+    if yesterday_sales > 0:
+        trend_pct = round(((today_sales - yesterday_sales) / yesterday_sales) * 100)
+
+    # 2. Daily Sales (Last 7 Days) ending at end_dt
+    end_date_str = end_dt.strftime("%Y-%m-%d")
+    end_day_start = datetime(end_dt.year, end_dt.month, end_dt.day)
+
+    daily_totals = source.buckets('day', (end_day_start - timedelta(days=6)).strftime("%Y-%m-%d"), end_date_str)
+    daily_map = {}
+    for i in range(6, -1, -1):  # 6 days ago through end date
+        d = end_dt - timedelta(days=i)
+        day_str = d.strftime("%Y-%m-%d")
+        is_end_day = (day_str == end_date_str)
+        is_today = (day_str == today_str)
+        label = "Today" if is_today else ("Selected day" if is_end_day and not is_today else d.strftime("%a %d"))
+        amount = daily_totals.get(day_str, {}).get('amount', 0)
+        daily_map[day_str] = {"date": day_str, "amount": amount, "label": label}
+    daily_sales = list(daily_map.values())
+    daily_sales.sort(key=lambda x: x["date"])
+    for d in daily_sales:
+        if d["date"] == today_str:
+            d["date"] = "Today"
+        else:
+            d["date"] = datetime.strptime(d["date"], "%Y-%m-%d").strftime("%a %d")
+
+    # 2b. Hourly Sales (Today)
+    hourly_totals = source.buckets('hour', f"{today_str} 00", f"{today_str} 23")
+    hourly_sales = [{"hour": f"{h:02d}:00", "amount": hourly_totals.get(f"{today_str} {h:02d}", {}).get('amount', 0)}
+                    for h in range(8, 23)]  # 8 AM to 10 PM
+
+    # 3. Monthly Sales: last 12 months (zeros for months with no sales)
+    month_keys = []
+    for i in range(12):  # 12 months: from 11 months ago to current month
+        month = now.month - 1 - i
+        year = now.year
+        while month <= 0:
+            month += 12
+            year -= 1
+        month_keys.append((year, month))
+    month_keys.reverse()  # oldest to newest (left to right on chart)
+
+    monthly_totals = source.buckets('month', "%04d-%02d" % month_keys[0], "%04d-%02d" % month_keys[-1])
+    monthly_sales = []
+    for year, month in month_keys:
+        label = datetime(year, month, 1).strftime("%b %Y")
+        amount = monthly_totals.get(f"{year:04d}-{month:02d}", {}).get('amount', 0)
+        monthly_sales.append({"month": label, "amount": amount})
+
+    # 3b. Weekly Sales: last 8 weeks (Mon–Sun)
+    this_monday = today_start - timedelta(days=today_start.weekday())
+    weekly_totals = source.buckets('week', (this_monday - timedelta(weeks=7)).strftime("%Y-%m-%d"),
+                                   this_monday.strftime("%Y-%m-%d"))
+    weekly_sales = []
+    for i in range(7, -1, -1):  # 8 weeks ago through this week
+        d = now - timedelta(weeks=i)
+        # Label: Monday of that week
+        monday = d - timedelta(days=d.weekday())
+        label = "This week" if i == 0 else monday.strftime("%d %b")
+        amount = weekly_totals.get(monday.strftime("%Y-%m-%d"), {}).get('amount', 0)
+        weekly_sales.append({"week": label, "amount": amount})
+
+    # 4. Category Distribution (categories are snapshotted onto each sale line)
+    category_totals = {}
+    for cat, amount in source.category_totals().items():
+        cat = cat or UNCATEGORISED  # lines whose product was gone before categories were recorded
+        category_totals[cat] = category_totals.get(cat, 0) + amount
+
+    total_cat_sum = sum(category_totals.values())
+    category_data = []
+    for cat, amount in category_totals.items():
+        category_data.append({
+            "category": cat,
+            "amount": amount,
+            "percentage": round((amount / total_cat_sum) * 100, 1) if total_cat_sum > 0 else 0
+        })
+
+    # Sort by percentage for cleaner donut
+    category_data.sort(key=lambda x: x['percentage'], reverse=True)
+
+    return {
+        "today_sales": today_sales,
+        "today_orders": today_orders_count,
+        "trend_pct": trend_pct,
+        "daily_sales": daily_sales,
+        "hourly_sales": hourly_sales,
+        "weekly_sales": weekly_sales,
+        "monthly_sales": monthly_sales,
+        "category_sales": category_data
+    }
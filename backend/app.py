@@ -1,15 +1,29 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
 from jinja2 import ChoiceLoader, FileSystemLoader
 from datetime import datetime, timedelta
 from functools import wraps
 import os
+import csv
+import io
 from dotenv import load_dotenv
+import queue
 import random
+import signal
+import sys
+import threading
+import time
 import urllib.parse
 
 load_dotenv()
 
 import db  # Import the new database module
+import config
+import exports
+import analytics
+import rfid_dedup
+import rfid_ingest
+import trolley_sessions
+import events
 import google.generativeai as genai
 from groq import Groq
 from openai import OpenAI
@@ -44,6 +58,9 @@ app.jinja_loader = ChoiceLoader([
 with app.app_context():
     db.init_db()
 
+# Hand the request's pooled SQLite connection back when the app context ends
+app.teardown_appcontext(db.close_request_connection)
+
 # Admin credentials
 ADMIN_CREDENTIALS = {
     "admin": "admin123"
@@ -84,8 +101,18 @@ os.makedirs(LOGS_DIR, exist_ok=True)
 AUDIT_LOG_FILE = os.path.join(LOGS_DIR, "staff_audit.jsonl")
 
 # In-Memory State for Trolley Monitoring (Volatile)
-# Structure: { 'T001': { 'last_beat': datetime, 'item_count': int, 'total': float } }
-TROLLEY_SESSIONS = {}
+# One TrolleySession per trolley; Online/Idle/Abandoned status is kept up to date by the registry
+TROLLEYS = trolley_sessions.SessionRegistry(config.TROLLEY_IDLE_AFTER, config.TROLLEY_ABANDONED_AFTER,
+                                            config.TROLLEY_EVICT_AFTER)
+TROLLEY_STATUS_COLORS = {trolley_sessions.ONLINE: "green", trolley_sessions.IDLE: "orange",
+                         trolley_sessions.ABANDONED: "red"}
+TROLLEY_ID_MAX_LEN = 32
+
+# Repeat reads of a tag lingering in the reader field are dropped before the cart write
+SCAN_FILTER = rfid_dedup.ScanDeduplicator(config.RFID_DEDUP_WINDOW)
+# Batches the reader re-sends after a lost reply are answered without re-applying them
+RFID_BATCHES = rfid_dedup.BatchLog()
+BATCH_ID_MAX_LEN = 64
 
 def log_staff_action(actor, action, target_id, details=None):
     """Append immutable log entry for staff actions."""
@@ -107,21 +134,82 @@ def log_staff_action(actor, action, target_id, details=None):
     except Exception as e:
         print(f"AUDIT LOG FAILURE: {e}") # Fail-open
 
-def update_trolley_heartbeat(cart_items):
-    """Update in-memory heartbeat for the single active trolley."""
+def get_trolley_id(data=None):
+    """Trolley/device ID from the JSON body or ?trolley_id=, falling back to the default trolley."""
+    trolley_id = (data or {}).get('trolley_id') or request.args.get('trolley_id')
+    trolley_id = str(trolley_id or '').strip()[:TROLLEY_ID_MAX_LEN]
+    return trolley_id or config.DEFAULT_TROLLEY_ID
+
+# Distinguishes cart ETags issued before a restart, when cart versions start over
+BOOT_ID = os.urandom(4).hex()
+
+def cart_etag(trolley_id):
+    """Changes whenever the trolley's cart or any product in the catalog changes."""
+    return f"{BOOT_ID}-{db.cart_version(trolley_id)}-{db.catalog_version()}"
+
+def load_cart(trolley_id):
+    """Read a trolley's cart and its running totals together with the ETag they were read at."""
+    # Tag first: a write landing in between then only makes the tag look stale
+    etag = cart_etag(trolley_id)
+    cart, totals = db.get_cart(trolley_id)
+    return cart, totals, etag
+
+def update_trolley_heartbeat(trolley_id, cart_items, totals, etag=None):
+    """Update in-memory heartbeat for one trolley, keeping the cart it was computed from."""
     try:
-        total = sum(item['final_price'] * item['qty'] for item in cart_items.values())
-        count = sum(item['qty'] for item in cart_items.values())
-        
-        TROLLEY_SESSIONS['T001'] = {
-            'last_beat': datetime.now(),
-            'item_count': count,
-            'total': total,
-            'customer': 'Guest' # Placeholder for future expansion
-        }
+        TROLLEYS.beat(trolley_id, totals['item_count'], totals['net'], cart_items, etag)
     except Exception as e:
         print(f"Heartbeat Error: {e}")
 
+# Cart and promotion changes are pushed to kiosks over /cart/stream
+EVENTS = events.EventBus()
+
+def cart_payload(cart_items, total=0):
+    """Same shape as the GET /cart response."""
+    return {"items": cart_items, "total": total}
+
+def cart_changed(trolley_id, cart_items, totals, etag=None):
+    """Heartbeat a trolley after a cart write and push the new cart to its kiosk."""
+    update_trolley_heartbeat(trolley_id, cart_items, totals, etag)
+    EVENTS.publish(trolley_id, "cart", cart_payload(cart_items, totals['net']))
+
+def refresh_trolley_heartbeats(trolley_ids):
+    """Heartbeat trolleys whose carts were changed by the async RFID writer."""
+    for trolley_id in trolley_ids:
+        cart_changed(trolley_id, *load_cart(trolley_id))
+
+# Dashboard series and top products come from the configured analytics source
+# and are cached until the next sale
+ANALYTICS = analytics.get_source(config.ANALYTICS_BACKEND)
+ANALYTICS_CACHE = analytics.ResultCache()
+
+# Banner rotation slot and the promotion chosen for it. Every stream and poll
+# within a slot gets the same object; promotions_changed() forces a re-pick.
+PROMO_ROTATION_SECONDS = 1800
+PROMO_STATE = {"slot": None, "promotion": None}
+PROMO_LOCK = threading.Lock()
+
+def current_promotion():
+    slot = int(time.time() // PROMO_ROTATION_SECONDS)
+    with PROMO_LOCK:
+        if PROMO_STATE['slot'] != slot:
+            PROMO_STATE['promotion'] = db.get_current_promotion()
+            PROMO_STATE['slot'] = slot
+        return PROMO_STATE['promotion']
+
+def promotions_changed():
+    with PROMO_LOCK:
+        PROMO_STATE['slot'] = None
+    EVENTS.publish(events.PROMOTIONS_TOPIC, "promotion", current_promotion())
+
+# Async RFID ingest: scans are queued by /rfid and applied by one writer thread
+ASYNC_INGEST = config.RFID_INGEST_MODE == "async"
+INGEST_QUEUE = rfid_ingest.IngestQueue(on_applied=refresh_trolley_heartbeats)
+
+def scans_pending():
+    """503 for a cart write that must not run before the queued scans land."""
+    return jsonify({"status": "error", "message": "Scans are still being saved, please retry"}), 503, {"Retry-After": "1"}
+
 # ==================== AUTH ROUTES ====================
 
 @app.route('/admin/login', methods=['GET'])
@@ -234,14 +322,8 @@ def emergency_freeze_product():
         return jsonify({"status": "error", "message": "ID required"}), 400
         
     try:
-        # Utilizing ui_settings to store frozen state (extending existing schema usage)
-        settings = db.get_ui_settings()
-        frozen_list = json.loads(settings.get('frozen_products', '[]'))
-        
-        if pid not in frozen_list:
-            frozen_list.append(pid)
-            db.update_ui_settings({'frozen_products': json.dumps(frozen_list)})
-            
+        db.freeze_product(pid)
+
         log_staff_action(session.get('admin_username', 'admin'), "FREEZE_PRODUCT", pid, {"reason": "Admin Emergency Action"})
         return jsonify({"status": "success", "message": f"Product {pid} frozen."})
     except Exception as e:
@@ -255,13 +337,8 @@ def emergency_unfreeze_product():
     pid = data.get('id')
     
     try:
-        settings = db.get_ui_settings()
-        frozen_list = json.loads(settings.get('frozen_products', '[]'))
-        
-        if pid in frozen_list:
-            frozen_list.remove(pid)
-            db.update_ui_settings({'frozen_products': json.dumps(frozen_list)})
-            
+        db.unfreeze_product(pid)
+
         log_staff_action(session.get('admin_username', 'admin'), "UNFREEZE_PRODUCT", pid, {"reason": "Admin Emergency Action"})
         return jsonify({"status": "success", "message": f"Product {pid} unfrozen."})
     except Exception as e:
@@ -272,13 +349,15 @@ def emergency_unfreeze_product():
 def emergency_reset_trolley():
     """Emergency Control: Force clear trolley session"""
     try:
-        db.clear_cart()
+        trolley_id = get_trolley_id(request.get_json(silent=True))
+        db.clear_cart(trolley_id)
         # Reset in-memory state
-        if 'T001' in TROLLEY_SESSIONS:
-            del TROLLEY_SESSIONS['T001']
+        TROLLEYS.remove(trolley_id)
+        SCAN_FILTER.forget(trolley_id)
+        EVENTS.publish(trolley_id, "cart", cart_payload({}))
             
-        log_staff_action(session.get('admin_username', 'admin'), "RESET_TROLLEY", "T001", {"reason": "Admin Emergency Reset"})
-        return jsonify({"status": "success", "message": "Trolley session force-cleared."})
+        log_staff_action(session.get('admin_username', 'admin'), "RESET_TROLLEY", trolley_id, {"reason": "Admin Emergency Reset"})
+        return jsonify({"status": "success", "message": f"Trolley {trolley_id} session force-cleared."})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -355,33 +434,53 @@ def worker_get_props():
     # Deprecated endpoint matching specific frontend call if necessary, else identical to products
     return jsonify(db.get_all_products())
 
+# Type of each optional product field a worker may supply
+PRODUCT_FIELD_TYPES = {
+    "name": str,
+    "unit": str,
+    "price": float,
+    "stock": int,
+    "discount": float,
+    "promotion_description": str,
+    "promotion_expiry": str,
+    "category": str,
+    "image": str
+}
+
+def validate_product(data):
+    """
+    Check and convert a product submitted by a worker (JSON object or CSV row).
+    Returns (fields, error): fields holds only the values actually supplied,
+    blank CSV cells are treated as not supplied.
+    """
+    for field in ['id', 'name', 'price']:
+        if data.get(field) in (None, ''):
+            return None, f"Missing field: {field}"
+
+    fields = {"id": str(data['id']).strip()}
+    for field, cast in PRODUCT_FIELD_TYPES.items():
+        value = data.get(field)
+        if value in (None, ''):
+            continue
+        try:
+            fields[field] = cast(value.strip() if isinstance(value, str) else value)
+        except (TypeError, ValueError):
+            return None, f"Invalid {field}: {value}"
+
+    if not (0 <= fields.get('discount', 0) <= 90):
+        return None, "Discount must be between 0 and 90%"
+    return fields, None
+
 @app.route('/api/worker/add-product', methods=['POST'])
 @worker_login_required
 def worker_add_product():
     data = request.get_json()
     
     # Validation
-    required_fields = ['id', 'name', 'price']
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"success": False, "message": f"Missing field: {field}"}), 400
-            
-    product_data = {
-        "id": data['id'],
-        "name": data['name'],
-        "unit": data.get('unit', ''),
-        "price": float(data['price']),
-        "stock": int(data.get('stock', 0)),
-        "discount": float(data.get('discount', 0)),
-        "promotion_description": data.get('promotion_description', ''),
-        "promotion_expiry": data.get('promotion_expiry', ''),
-        "category": data.get('category', 'General'),
-        "image": data.get('image', '/customer-frontend/static/images/default.png')
-    }
-    
-    # Validate Discount
-    if not (0 <= product_data['discount'] <= 90):
-        return jsonify({"success": False, "message": "Discount must be between 0 and 90%"}), 400
+    fields, error = validate_product(data)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    product_data = {**db.PRODUCT_DEFAULTS, **fields}
     
     if db.add_product(product_data):
         log_staff_action(
@@ -394,6 +493,66 @@ def worker_add_product():
     else:
         return jsonify({"success": False, "message": "Product ID already exists"}), 400
 
+@app.route('/api/worker/import-products', methods=['POST'])
+@worker_login_required
+def worker_import_products():
+    """
+    Bulk add/update products. Accepts a CSV upload (multipart field 'file', or a
+    text/csv body) with a header row, or a JSON array of product objects.
+    Valid rows are upserted in one transaction; invalid rows are reported back
+    by row number and skipped.
+    """
+    if 'file' in request.files:
+        source = "csv"
+        rows = csv.DictReader(io.TextIOWrapper(request.files['file'].stream, encoding='utf-8-sig'))
+    elif request.mimetype == 'text/csv':
+        source = "csv"
+        rows = csv.DictReader(io.StringIO(request.get_data(as_text=True).lstrip('\ufeff')))
+    else:
+        source = "json"
+        rows = request.get_json(silent=True)
+        if isinstance(rows, dict):
+            rows = rows.get('products')
+        if not isinstance(rows, list):
+            return jsonify({"success": False, "message": "Expected a CSV file or a JSON array of products"}), 400
+
+    products = []
+    errors = []
+    try:
+        for row_num, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                errors.append({"row": row_num, "message": "Row is not an object"})
+                continue
+            fields, error = validate_product(row)
+            if error:
+                errors.append({"row": row_num, "id": row.get('id'), "message": error})
+            else:
+                products.append(fields)
+    except (csv.Error, UnicodeDecodeError) as e:
+        return jsonify({"success": False, "message": f"Could not read CSV: {e}"}), 400
+
+    if not products:
+        return jsonify({"success": False, "message": "No valid products to import", "imported": 0, "errors": errors}), 400
+
+    try:
+        imported = db.upsert_products(products)
+    except Exception as e:
+        print(f"Error importing products: {e}")
+        return jsonify({"success": False, "message": "Import failed, no products were changed"}), 500
+
+    log_staff_action(
+        session.get('worker_username'),
+        "BULK_IMPORT_PRODUCTS",
+        f"{imported} products",
+        details={"source": source, "imported": imported, "rejected": len(errors)}
+    )
+    return jsonify({
+        "success": True,
+        "message": f"Imported {imported} products" + (f", {len(errors)} rows rejected" if errors else ""),
+        "imported": imported,
+        "errors": errors
+    })
+
 @app.route('/api/worker/update-product', methods=['POST'])
 @worker_login_required
 def worker_update_product():
@@ -457,36 +616,131 @@ def get_products():
 def rfid():
     data = request.get_json()
     uid = data.get("uid")
+    trolley_id = get_trolley_id(data)
 
     # 1. EMERGENCY CHECK: Is Product Frozen?
-    settings = db.get_ui_settings()
-    frozen_list = json.loads(settings.get('frozen_products', '[]'))
-    
-    if uid in frozen_list:
+    if db.is_frozen(uid):
         return jsonify({"status": "error", "message": "Item blocked by Admin"}), 403
 
     product = db.get_product(uid)
     if not product:
         return jsonify({"status": "error", "message": "Product not found", "uid": uid}), 404
 
-    db.add_to_cart(uid)
-    cart = db.get_cart_items() # Fetch updated cart
+    # Same tag still in the reader field: nothing to do. Only reader traffic
+    # ("source": "reader") is filtered; kiosk "+" taps are deliberate adds.
+    if data.get("source") == "reader" and not SCAN_FILTER.accept(trolley_id, uid):
+        return jsonify({"status": "ok", "duplicate": True, "message": "Duplicate read ignored"})
+
+    if ASYNC_INGEST:
+        # Acknowledge now; the kiosk sees the item on its next /cart refresh
+        INGEST_QUEUE.submit(trolley_id, uid)
+        return jsonify({"status": "queued", "uid": uid}), 202
+
+    db.add_to_cart(trolley_id, uid)
+    cart, totals, etag = load_cart(trolley_id) # Fetch updated cart
     
-    # 2. Update Heartbeat
-    update_trolley_heartbeat(cart)
+    # 2. Update Heartbeat and push to the kiosk
+    cart_changed(trolley_id, cart, totals, etag)
 
     return jsonify({"status": "ok", "cart": cart})
 
+@app.route('/rfid/batch', methods=['POST'])
+def rfid_batch():
+    """
+    Add every scan from one scan window in a single round trip.
+    Body: {"trolley_id": "T01", "batch_id": "...", "scans": [{"uid": "...", "ts": 1234}, ...]}
+    ("uids": [...] is accepted too). ts orders the scans and spaces them out
+    for the duplicate-read filter. Frozen or unknown tags are returned in
+    "rejected", repeat reads are only counted; the rest go into the cart in
+    one transaction and a single cart snapshot is returned (in async ingest
+    mode they are queued instead and 202 is returned without a cart).
+    A batch_id that was already applied for this trolley is answered with
+    "resent": true and the current cart, without adding its scans again.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Expected a JSON object"}), 400
+    trolley_id = get_trolley_id(data)
+    scans = data.get('scans')
+    if scans is None:
+        uids = data.get('uids') or []
+        if not isinstance(uids, list):
+            return jsonify({"status": "error", "message": "Expected a list of scans"}), 400
+        scans = [{"uid": uid} for uid in uids]
+    if not isinstance(scans, list) or not all(isinstance(s, dict) for s in scans):
+        return jsonify({"status": "error", "message": "Expected a list of scans"}), 400
+    if len(scans) > config.RFID_BATCH_MAX:
+        return jsonify({"status": "error", "message": f"At most {config.RFID_BATCH_MAX} scans per batch"}), 400
+    batch_id = data.get('batch_id')
+    if batch_id is None:
+        return apply_scan_batch(trolley_id, scans)
+    batch_id = str(batch_id)[:BATCH_ID_MAX_LEN]
+
+    claim = RFID_BATCHES.claim(trolley_id, batch_id)
+    if claim == "applied":
+        cart, _, _ = load_cart(trolley_id)
+        return jsonify({"status": "ok", "resent": True, "added": [], "rejected": [], "duplicates": 0, "cart": cart})
+    if claim == "pending":
+        return jsonify({"status": "error", "message": "Batch is still being applied, please retry"}), 503, {"Retry-After": "1"}
+    applied = False
+    try:
+        response = apply_scan_batch(trolley_id, scans)
+        applied = True
+        return response
+    finally:
+        RFID_BATCHES.finish(trolley_id, batch_id, applied)
+
+def apply_scan_batch(trolley_id, scans):
+    """Filter and add one validated /rfid/batch scan list, returning the response."""
+    scans = sorted(scans, key=lambda s: s.get('ts') if isinstance(s.get('ts'), (int, float)) else 0)
+
+    # Device timestamps (ms) place each scan relative to the newest one in the batch
+    now = time.monotonic()
+    last_ts = max([s['ts'] for s in scans if isinstance(s.get('ts'), (int, float))], default=0)
+
+    added = []
+    rejected = []
+    duplicates = 0
+    for scan in scans:
+        uid = scan.get('uid')
+        ts = scan.get('ts')
+        scan_time = now - (last_ts - ts) / 1000 if isinstance(ts, (int, float)) else now
+        if not isinstance(uid, str) or not uid:
+            rejected.append({"uid": uid, "message": "Invalid UID"})
+        elif db.is_frozen(uid):
+            rejected.append({"uid": uid, "message": "Item blocked by Admin"})
+        elif not db.get_product(uid):
+            rejected.append({"uid": uid, "message": "Product not found"})
+        elif not SCAN_FILTER.accept(trolley_id, uid, scan_time):
+            duplicates += 1
+        else:
+            added.append(uid)
+
+    if ASYNC_INGEST:
+        for uid in added:
+            INGEST_QUEUE.submit(trolley_id, uid)
+        return jsonify({"status": "queued", "added": added, "rejected": rejected, "duplicates": duplicates}), 202
+
+    if added:
+        db.add_many_to_cart(trolley_id, added)
+    cart, totals, etag = load_cart(trolley_id)
+    cart_changed(trolley_id, cart, totals, etag)
+
+    return jsonify({"status": "ok", "added": added, "rejected": rejected, "duplicates": duplicates, "cart": cart})
+
 @app.route('/cart/remove', methods=['POST'])
 def remove_from_cart():
     data = request.get_json()
     uid = data.get("uid")
+    trolley_id = get_trolley_id(data)
+    if ASYNC_INGEST and not INGEST_QUEUE.flush():
+        return scans_pending()
     
-    if db.remove_from_cart(uid):
-        cart = db.get_cart_items()
+    if db.remove_from_cart(trolley_id, uid):
+        cart, totals, etag = load_cart(trolley_id)
         
-        # Update Heartbeat
-        update_trolley_heartbeat(cart)
+        # Update Heartbeat and push to the kiosk
+        cart_changed(trolley_id, cart, totals, etag)
         
         return jsonify({"status": "ok", "cart": cart})
     
@@ -494,34 +748,93 @@ def remove_from_cart():
 
 @app.route('/cart', methods=['GET'])
 def get_cart():
-    cart = db.get_cart_items()
-    # Update Heartbeat on Polling too (Active View)
-    update_trolley_heartbeat(cart)
-    
-    # Calculate total using final_price (discounted)
-    total = sum(item['final_price'] * item['qty'] for item in cart.values())
-    return jsonify({"items": cart, "total": total})
+    """
+    Current cart for a trolley. Responses carry an ETag; a poll sending it back
+    in If-None-Match gets 304 while the cart is unchanged. Either way an
+    unchanged cart is answered from the heartbeat without a DB read.
+    """
+    trolley_id = get_trolley_id()
+    etag = cart_etag(trolley_id)
+    beat = TROLLEYS.get(trolley_id)
+    if beat is not None and beat.etag == etag:
+        # Update Heartbeat on Polling too (Active View)
+        TROLLEYS.touch(trolley_id)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = jsonify({"items": beat.cart, "total": beat.total})
+    else:
+        cart, totals, etag = load_cart(trolley_id)
+        update_trolley_heartbeat(trolley_id, cart, totals, etag)
+        
+        # Running total of final_price (discounted), kept by the cart writes
+        response = jsonify({"items": cart, "total": totals['net']})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/checkout', methods=['POST'])
 def checkout():
     data = request.get_json() or {}
     discount_percent = float(data.get('discount', 0))
+    trolley_id = get_trolley_id(data)
+    if ASYNC_INGEST and not INGEST_QUEUE.flush():
+        # Scans still queued for this trolley belong in this bill
+        return scans_pending()
     
-    cart = db.get_cart_items()
+    cart, totals = db.get_cart(trolley_id)
     if not cart:
         return jsonify({"status": "error", "message": "Cart is empty"}), 400
 
-    total = sum(item['final_price'] * item['qty'] for item in cart.values())
+    total = totals['net']
     
     # Record sale in DB (this also updates stock and clear cart)
-    order = db.record_sale(cart, total, discount_percent)
+    order = db.record_sale(trolley_id, cart, total, discount_percent)
     
     # Clear Heartbeat Session
-    if 'T001' in TROLLEY_SESSIONS:
-        del TROLLEY_SESSIONS['T001']
+    TROLLEYS.remove(trolley_id)
+    SCAN_FILTER.forget(trolley_id)
+    EVENTS.publish(trolley_id, "cart", cart_payload({}))
         
     return jsonify({"status": "ok", "message": "Checkout successful", "order": order})
 
+@app.route('/cart/stream', methods=['GET'])
+def cart_stream():
+    """
+    Server-Sent Events for one kiosk: a "cart" event (same body as GET /cart)
+    whenever the trolley's cart changes and a "promotion" event when the
+    banner rotation slot or the promotion list changes. Comment lines are sent
+    as keepalives and count as a heartbeat, like a /cart poll.
+    """
+    trolley_id = get_trolley_id()
+    # No stream_with_context: the generator must not hold the request's pooled
+    # connection for as long as the kiosk stays connected.
+    def generate():
+        sub = EVENTS.subscribe(trolley_id, events.PROMOTIONS_TOPIC)
+        try:
+            cart, totals, etag = load_cart(trolley_id)
+            update_trolley_heartbeat(trolley_id, cart, totals, etag)
+            yield events.sse("cart", cart_payload(cart, totals['net']))
+            promo = current_promotion()
+            yield events.sse("promotion", promo)
+            while True:
+                try:
+                    event, data = sub.get(timeout=config.SSE_KEEPALIVE_SECONDS)
+                    if event == "promotion":
+                        promo = data
+                    yield events.sse(event, data)
+                except queue.Empty:
+                    TROLLEYS.touch(trolley_id)
+                    yield ": keepalive\n\n"
+                if current_promotion() is not promo:
+                    promo = current_promotion()
+                    yield events.sse("promotion", promo)
+        finally:
+            EVENTS.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/promotions', methods=['GET'])
 def get_promotions():
     """Fetch all active promotions"""
@@ -552,11 +865,11 @@ def get_promotions():
 @app.route('/admin/data', methods=['GET'])
 @login_required
 def get_admin_data():
-    sales_history = db.get_sales_history()
+    summary = db.get_sales_summary()
     products = db.get_all_products()
     
-    total_sales = sum(order['total'] for order in sales_history)
-    total_orders = len(sales_history)
+    total_sales = summary['revenue']
+    total_orders = summary['orders']
     total_products = len(products)
     low_stock_items = [p for p in products.values() if p['stock'] < 5]
     
@@ -587,7 +900,7 @@ def update_settings():
 @app.route('/api/promotions/current', methods=['GET'])
 def get_current_promo():
     """Get the currently active promotion (rotates every 30 mins)"""
-    promo = db.get_current_promotion()
+    promo = current_promotion()
     return jsonify(promo if promo else {"type": "none"})
 
 @app.route('/api/worker/promotions/list', methods=['GET'])
@@ -604,6 +917,7 @@ def add_worker_promotion():
         return jsonify({"success": False, "message": "Missing required fields"}), 400
         
     if db.add_promotion(data['type'], data['title'], data.get('content', {})):
+        promotions_changed()
         return jsonify({"success": True, "message": "Promotion added"})
     else:
         return jsonify({"success": False, "message": "Failed to add promotion"}), 500
@@ -612,6 +926,7 @@ def add_worker_promotion():
 @worker_login_required
 def delete_worker_promotion(pid):
     if db.delete_promotion(pid):
+        promotions_changed()
         return jsonify({"success": True, "message": "Promotion deleted"})
     else:
         return jsonify({"success": False, "message": "Failed to delete"}), 500
@@ -625,186 +940,57 @@ def get_inventory():
 @login_required
 def get_admin_analytics():
     try:
-        sales_history = db.get_sales_history() or []
         products = db.get_all_products() or {}
         
-        # Date strings
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        yesterday_str = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-
-        # 1. Today's Stats (Strictly Correct Data)
-        today_sales = sum(o.get('total', 0) for o in sales_history if str(o.get('timestamp', '')).startswith(today_str))
-        today_orders_count = len([o for o in sales_history if str(o.get('timestamp', '')).startswith(today_str)])
-        
-        # Calculate trend (vs Yesterday)
-        yesterday_sales = sum(o.get('total', 0) for o in sales_history if str(o.get('timestamp', '')).startswith(yesterday_str))
-        trend_pct = 0
-        if yesterday_sales > 0:
-            trend_pct = round(((today_sales - yesterday_sales) / yesterday_sales) * 100)
-        
-        # Active Trolleys (Single Trolley Project: 1 if cart has items, 0 otherwise)
-        cart_items = db.get_cart_items()
-        active_trolleys = 1 if cart_items else 0
+        # Active Trolleys (trolleys with items in their cart)
+        active_trolleys = db.count_active_trolleys()
         
         # Low Stock
         low_stock_count = len([p for p in products.values() if p.get('stock', 0) < 5])
 
-        
-        # 2. Daily Sales (Last 7 Days) - REAL data; optional end_date for calendar pick
+        # Optional end_date for the calendar pick on the 7-day chart
+        now = datetime.now()
         end_date_str = request.args.get('end_date')  # YYYY-MM-DD
         if end_date_str:
             try:
                 end_dt = datetime.strptime(end_date_str, "%Y-%m-%d")
-                if end_dt.date() > datetime.now().date():
-                    end_dt = datetime.now()
+                if end_dt.date() > now.date():
+                    end_dt = now
             except (ValueError, TypeError):
-                end_dt = datetime.now()
+                end_dt = now
         else:
-            end_dt = datetime.now()
-        end_date_str = end_dt.strftime("%Y-%m-%d")
-
-        daily_map = {}
-        for i in range(6, -1, -1):  # 6 days ago through end date
-            d = end_dt - timedelta(days=i)
-            day_str = d.strftime("%Y-%m-%d")
-            is_end_day = (day_str == end_date_str)
-            is_today = (day_str == today_str)
-            label = "Today" if is_today else ("Selected day" if is_end_day and not is_today else d.strftime("%a %d"))
-            daily_map[day_str] = {"date": day_str, "amount": 0, "label": label}
-        for o in sales_history:
-            ts = str(o.get('timestamp', ''))[:10]
-            if ts in daily_map:
-                daily_map[ts]["amount"] += o.get('total', 0)
-        daily_sales = list(daily_map.values())
-        daily_sales.sort(key=lambda x: x["date"])
-        for i, d in enumerate(daily_sales):
-            if d["date"] == today_str:
-                d["date"] = "Today"
-            elif d["date"] == end_date_str and end_date_str != today_str:
-                d["date"] = datetime.strptime(d["date"], "%Y-%m-%d").strftime("%a %d")
-            else:
-                d["date"] = datetime.strptime(d["date"], "%Y-%m-%d").strftime("%a %d")
-        
-        # 2b. Hourly Sales (Today)
-        sales_by_hour = {h: 0 for h in range(8, 23)} # 8 AM to 10 PM
-        for o in sales_history:
-            if str(o.get('timestamp', '')).startswith(today_str):
-                try:
-                    dt = datetime.fromisoformat(o.get('timestamp'))
-                    h = dt.hour
-                    if 8 <= h <= 22:
-                        sales_by_hour[h] += o.get('total', 0)
-                except:
-                    pass
-        
-        hourly_sales = [{"hour": f"{h:02d}:00", "amount": sales_by_hour[h]} for h in range(8, 23)]
-
-        # 3. Monthly Sales: last 12 months with REAL data (zeros for months with no sales)
-        monthly_map = {}
-        for order in sales_history:
-            ts = order.get('timestamp', '')
-            try:
-                date_obj = datetime.fromisoformat(ts)
-                month_key = (date_obj.year, date_obj.month)
-                monthly_map[month_key] = monthly_map.get(month_key, 0) + order.get('total', 0)
-            except Exception:
-                continue
+            end_dt = now
+
+        # Today's stats, chart series and recent sales only change with a sale
+        # (or the date), so they are served from the cache between checkouts
+        def compute():
+            recent_sales = []
+            for s in db.get_recent_sales(limit=5):
+                recent_sales.append({
+                    "id": s['id'],
+                    "timestamp": s['timestamp'],
+                    "total": s['total'],
+                    "items_count": s['items_count']
+                })
+            return analytics.build_dashboard(ANALYTICS, now, end_dt), recent_sales
 
-        now = datetime.now()
-        monthly_sales = []
-        for i in range(12):  # 12 months: from 11 months ago to current month
-            month = now.month - 1 - i
-            year = now.year
-            while month <= 0:
-                month += 12
-                year -= 1
-            month_key = (year, month)
-            label = datetime(year, month, 1).strftime("%b %Y")
-            amount = monthly_map.get(month_key, 0)
-            monthly_sales.append({"month": label, "amount": amount})
-        monthly_sales.reverse()  # oldest to newest (left to right on chart)
-
-        # 3b. Weekly Sales: last 8 weeks (Mon–Sun) with REAL data
-        weekly_map = {}
-        for order in sales_history:
-            ts = order.get('timestamp', '')
-            try:
-                date_obj = datetime.fromisoformat(ts)
-                # ISO week: (year, week number)
-                year, week, _ = date_obj.isocalendar()
-                week_key = (year, week)
-                weekly_map[week_key] = weekly_map.get(week_key, 0) + order.get('total', 0)
-            except Exception:
-                continue
-        now = datetime.now()
-        weekly_sales = []
-        for i in range(7, -1, -1):  # 8 weeks ago through this week
-            d = now - timedelta(weeks=i)
-            year, week, _ = d.isocalendar()
-            week_key = (year, week)
-            # Label: Monday of that week
-            monday = d - timedelta(days=d.weekday())
-            label = "This week" if i == 0 else monday.strftime("%d %b")
-            amount = weekly_map.get(week_key, 0)
-            weekly_sales.append({"week": label, "amount": amount})
-        
-        # 4. REAL Category Distribution
-        category_totals = {}
-        for order in sales_history:
-            items = order.get('items', [])
-            if isinstance(items, str):
-                try: items = json.loads(items)
-                except: items = []
-            
-            for item in items:
-                cat = item.get('category', 'Grocery') # Default to Grocery for aesthetic richness
-                price = item.get('final_price', item.get('price', 0))
-                qty = item.get('qty', 1)
-                amount = price * qty
-                category_totals[cat] = category_totals.get(cat, 0) + amount
-        
-        # If real history is small, MERGE with mock for a better visual
-        mock_cats = {"Grocery": 3500, "Dairy": 2500, "Snacks": 2000, "Beverages": 1500}
-        for c, v in mock_cats.items():
-            category_totals[c] = category_totals.get(c, 0) + v
-        
-        total_cat_sum = sum(category_totals.values())
-        category_data = []
-        for cat, amount in category_totals.items():
-            category_data.append({
-                "category": cat,
-                "amount": amount,
-                "percentage": round((amount / total_cat_sum) * 100, 1) if total_cat_sum > 0 else 0
-            })
-        
-        # Sort by percentage for cleaner donut
-        category_data.sort(key=lambda x: x['percentage'], reverse=True)
-            
-        # 5. Recent Sales
-        recent_sales = []
-        for s in list(reversed(sales_history))[:5]:
-            items = s.get('items', [])
-            recent_sales.append({
-                "id": s.get('id', '???'),
-                "timestamp": s.get('timestamp', ''),
-                "total": s.get('total', 0),
-                "items_count": len(items) if isinstance(items, list) else 0
-            })
+        cache_key = ("analytics", now.strftime("%Y-%m-%d"), end_dt.strftime("%Y-%m-%d"))
+        dashboard, recent_sales = ANALYTICS_CACHE.get(cache_key, db.sales_version(), compute)
 
         return jsonify({
             "status": "success",
             "stats": {
-                "total_sales": today_sales,       # Displaying TODAY'S sales per request
-                "total_orders": today_orders_count, # Displaying TODAY'S bills
+                "total_sales": dashboard["today_sales"],   # Displaying TODAY'S sales per request
+                "total_orders": dashboard["today_orders"], # Displaying TODAY'S bills
                 "active_trolleys": active_trolleys,
                 "low_stock_count": low_stock_count,
-                "trend_pct": trend_pct
+                "trend_pct": dashboard["trend_pct"]
             },
-            "daily_sales": daily_sales,
-            "hourly_sales": hourly_sales,
-            "weekly_sales": weekly_sales,
-            "monthly_sales": monthly_sales,
-            "category_sales": category_data,
+            "daily_sales": dashboard["daily_sales"],
+            "hourly_sales": dashboard["hourly_sales"],
+            "weekly_sales": dashboard["weekly_sales"],
+            "monthly_sales": dashboard["monthly_sales"],
+            "category_sales": dashboard["category_sales"],
             "recent_sales": recent_sales
         })
     except Exception as e:
@@ -878,15 +1064,13 @@ def get_admin_alerts():
                         continue
 
         # 3. CONTEXT ALERTS (Trolley State)
-        if 'T001' in TROLLEY_SESSIONS:
-            t = TROLLEY_SESSIONS['T001']
-            last_beat = t['last_beat']
-            delta = (datetime.now() - last_beat).total_seconds()
+        for t in TROLLEYS.with_status(trolley_sessions.ABANDONED):
+            delta = t.idle_seconds()
             
-            if delta > 300 and t['total'] > 500: # 5 mins idle + >500 value
+            if t.total > 500: # 5 mins idle + >500 value
                 alerts.append({
-                    "id": "ctx-aband-high",
-                    "message": f"High Value Cart Abandoned (₹{t['total']}). Idle for {int(delta/60)} mins.",
+                    "id": f"ctx-aband-high-{t.trolley_id}",
+                    "message": f"High Value Cart Abandoned on {t.trolley_id} (₹{t.total}). Idle for {int(delta/60)} mins.",
                     "type": "operations",
                     "priority": "medium",
                     "time": "Just now"
@@ -907,72 +1091,145 @@ def get_admin_trolleys():
     """Return real-time trolley status based on in-memory heartbeats."""
     trolleys = []
     try:
-        if 'T001' in TROLLEY_SESSIONS:
-            data = TROLLEY_SESSIONS['T001']
-            last_beat = data['last_beat']
-            delta = (datetime.now() - last_beat).total_seconds()
-            
-            # Determine Status
-            if delta < 60:
-                status = "Online"
-                status_color = "green"
-            elif delta < 300:
-                status = "Idle"
-                status_color = "orange"
-            else:
-                status = "Abandoned"
-                status_color = "red"
+        now = datetime.now()
+        for t in TROLLEYS.sessions():
+            delta = t.idle_seconds()
+            last_beat = now - timedelta(seconds=delta)
             
             trolleys.append({
-                "id": "T001",
-                "customer": data.get('customer', 'Guest'),
+                "id": t.trolley_id,
+                "customer": t.customer,
                 "startTime": last_beat.strftime("%I:%M %p"), # Approx/Last active
-                "items": data.get('item_count', 0),
-                "total": round(data.get('total', 0), 2),
+                "items": t.item_count,
+                "total": round(t.total, 2),
                 "timeInStore": f"{int(delta/60)}m ago", # Showing last active
-                "status": status,
-                "statusColor": status_color
+                "status": t.status,
+                "statusColor": TROLLEY_STATUS_COLORS[t.status]
             })
             
         return jsonify({"status": "success", "trolleys": trolleys})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e), "trolleys": []}), 500
 
+@app.route('/api/admin/metrics', methods=['GET'])
+@login_required
+def get_admin_metrics():
+    """Runtime counters for the RFID ingest, cart and analytics paths (per process, reset on restart)."""
+    return jsonify({
+        "status": "success",
+        "metrics": {
+            "rfid_dedup": SCAN_FILTER.stats(),
+            "rfid_batches": RFID_BATCHES.stats(),
+            "rfid_ingest": dict(INGEST_QUEUE.stats(), mode=config.RFID_INGEST_MODE),
+            "cart_streams": EVENTS.subscriber_count(),
+            "trolleys": TROLLEYS.stats(),
+            "cart_engine": db.cart_engine_stats(),
+            "analytics_cache": dict(ANALYTICS_CACHE.stats(), sales_version=db.sales_version())
+        }
+    })
+
+
+TOP_PRODUCTS_MAX = 100
 
 @app.route('/api/admin/reports/top-products', methods=['GET'])
 @login_required
 def get_reports_top_products():
-    """Aggregate top products by quantity and revenue from sales history (no DB change)."""
+    """
+    Top products by revenue, one row per product id (SQL over sale_items, or the NumPy columns).
+      ?limit=N (default 20, max TOP_PRODUCTS_MAX)
+      &from=YYYY-MM-DD&to=YYYY-MM-DD  optional inclusive date range
+    """
     try:
-        sales_history = db.get_sales_history() or []
-        agg = {}
-        for order in sales_history:
-            items = order.get('items', [])
-            if isinstance(items, str):
-                try:
-                    items = json.loads(items)
-                except Exception:
-                    items = []
-            for item in items:
-                name = item.get('name', 'Unknown')
-                qty = item.get('qty', 1)
-                price = item.get('final_price', item.get('price', 0))
-                rev = price * qty
-                if name not in agg:
-                    agg[name] = {'quantity': 0, 'revenue': 0}
-                agg[name]['quantity'] += qty
-                agg[name]['revenue'] += rev
-        top = [{"name": n, "quantity": d["quantity"], "revenue": round(d["revenue"], 2)} for n, d in agg.items()]
-        top.sort(key=lambda x: x["revenue"], reverse=True)
-        return jsonify({"status": "success", "top_products": top[:20]})
+        limit = min(max(int(request.args.get('limit', 20)), 1), TOP_PRODUCTS_MAX)
+        start, end = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit or date, expected YYYY-MM-DD", "top_products": []}), 400
+    try:
+        # Labels are current catalog names, so a rename also refreshes the entry
+        key = ("top-products", limit, request.args.get('from') or None, request.args.get('to') or None)
+        top_products = ANALYTICS_CACHE.get(key, (db.sales_version(), db.catalog_version()),
+                                           lambda: ANALYTICS.top_products(limit, start, end))
+        return jsonify({"status": "success", "top_products": top_products})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e), "top_products": []}), 500
 
 
+def parse_date_range(args):
+    """
+    Read optional 'from' / 'to' (YYYY-MM-DD, both inclusive) query args.
+    Returns (start, end) datetimes for a half-open [start, end) range; raises ValueError.
+    """
+    start = end = None
+    if args.get('from'):
+        start = datetime.strptime(args['from'], "%Y-%m-%d")
+    if args.get('to'):
+        end = datetime.strptime(args['to'], "%Y-%m-%d") + timedelta(days=1)
+    return start, end
+
+SALES_PAGE_MAX = 500
+
 @app.route('/sales/history', methods=['GET'])
 @login_required
 def get_sales_history_route():
-    return jsonify(db.get_sales_history())
+    """
+    Sales with their line items.
+      ?limit=N[&after_id=ID]             page oldest first; pass next_cursor back as after_id
+      ?limit=N&order=desc[&before_id=ID] page newest first; pass next_cursor back as before_id
+      ?format=ndjson           stream every matching sale, one JSON object per line
+      &from=YYYY-MM-DD&to=YYYY-MM-DD  optional date filter for all modes
+    Without any of these the whole history is returned as one list (legacy clients).
+    """
+    args = request.args
+    try:
+        start, end = parse_date_range(args)
+        after_id = int(args['after_id']) if args.get('after_id') else None
+        before_id = int(args['before_id']) if args.get('before_id') else None
+        limit = min(max(int(args.get('limit', 50)), 1), SALES_PAGE_MAX)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid date or cursor"}), 400
+
+    if args.get('format') == 'ndjson':
+        sales = db.iter_sales(after_id=after_id, start=start, end=end)
+        return Response(stream_with_context(exports.sales_ndjson(sales)), mimetype='application/x-ndjson')
+
+    if not any(k in args for k in ('limit', 'after_id', 'before_id', 'order', 'from', 'to')):
+        return jsonify(db.get_sales_history())
+
+    sales, next_cursor = db.get_sales_page(after_id=after_id, before_id=before_id, limit=limit, start=start, end=end,
+                                           newest_first=args.get('order') == 'desc')
+    return jsonify({"sales": sales, "next_cursor": next_cursor})
+
+@app.route('/api/admin/export/sales', methods=['GET'])
+@login_required
+def export_sales():
+    """
+    Download sales for accounting, streamed straight from the database.
+      ?format=csv (default, one row per line item) | ndjson (one sale per line)
+      &from=YYYY-MM-DD&to=YYYY-MM-DD  optional inclusive date range
+      &gzip=1                         compress on the fly (.gz download)
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"status": "error", "message": "format must be csv or ndjson"}), 400
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid date, expected YYYY-MM-DD"}), 400
+
+    sales = db.iter_sales(start=start, end=end)
+    if fmt == 'csv':
+        body, mimetype = exports.sales_csv(sales), 'text/csv'
+    else:
+        body, mimetype = exports.sales_ndjson(sales), 'application/x-ndjson'
+
+    filename = "sales_{}_{}.{}".format(request.args.get('from') or 'start', request.args.get('to') or 'now', fmt)
+    if request.args.get('gzip') in ('1', 'true'):
+        body, mimetype, filename = exports.gzip_stream(body), 'application/gzip', filename + '.gz'
+
+    log_staff_action(session.get('admin_username', 'admin'), "EXPORT_SALES", fmt,
+                     {"from": request.args.get('from'), "to": request.args.get('to')})
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
 
 @app.route('/chat', methods=['POST'])
 @login_required
@@ -980,12 +1237,15 @@ def chat():
     data = request.get_json()
     message = (data.get("message") or "").strip().lower()
 
-    sales_history = db.get_sales_history() or []
     products = db.get_all_products() or {}
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    today_sales = sum(o.get('total', 0) for o in sales_history if str(o.get('timestamp', ''))[:10] == today_str)
-    today_orders = len([o for o in sales_history if str(o.get('timestamp', ''))[:10] == today_str])
-    total_sales = sum(o.get('total', 0) for o in sales_history)
+    now = datetime.now()
+    today_start = datetime(now.year, now.month, now.day)
+    today_summary = db.get_sales_summary(today_start, today_start + timedelta(days=1))
+    all_time_summary = db.get_sales_summary()
+    today_sales = today_summary['revenue']
+    today_orders = today_summary['orders']
+    total_sales = all_time_summary['revenue']
+    total_orders = all_time_summary['orders']
     low_stock = [p for p in products.values() if p.get('stock', 0) < 5]
     out_of_stock = [p for p in products.values() if p.get('stock', 0) == 0]
 
@@ -1006,10 +1266,9 @@ def chat():
     elif any(w in message for w in ["today", "sales today", "today's sales", "revenue today"]):
         response = f"Today's sales: **₹{today_sales:,.2f}** from **{today_orders}** orders."
     elif any(w in message for w in ["total sales", "all sales", "overall sales", "revenue"]):
-        total_orders = len(sales_history)
         response = f"Total sales (all time): **₹{total_sales:,.2f}** from **{total_orders}** orders."
     elif any(w in message for w in ["orders", "bills", "transactions"]):
-        response = f"Today: **{today_orders}** orders. All time: **{len(sales_history)}** orders."
+        response = f"Today: **{today_orders}** orders. All time: **{total_orders}** orders."
     elif any(w in message for w in ["stock", "inventory", "low stock", "restock"]):
         if out_of_stock:
             names = ", ".join(p.get("name", "?") for p in out_of_stock[:5])
@@ -1299,5 +1558,14 @@ def generate_design():
             "note": "AI Error or Quota Exceeded. Running in Simulation Mode."
         })
 
+def handle_sigterm(signum, frame):
+    """
+    systemd stop: write pending in-memory cart changes before exiting. The
+    debug reloader installs its own handler, so this only applies with DEBUG off.
+    """
+    db.flush_carts()
+    sys.exit(0)  # unwinds through atexit (cart flusher, connection pool)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    app.run(host=config.HOST, port=config.PORT, debug=config.DEBUG)
\ No newline at end of file
@@ -0,0 +1,191 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Benchmark the admin dashboard numbers over N synthetic sales (1-4 lines each,
+# spread over the last 400 days). Compares the original multi-pass computation
+# over get_sales_history(), one analytics.SalesScan pass over iter_sales(), the
+# rollup tables and, when NumPy is installed, analytics.ColumnarSource, and
+# checks they all produce the same JSON. Runs against a throwaway database
+# unless DB_FILE is set.
+#   python bench_analytics.py [sales ...]
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench_analytics.db"))
+
+import analytics
+import db
+
+SALE_COUNTS = [1_000_000]
+
+def seed_sales(count):
+    db.init_db()
+    rng = random.Random(count)
+    products = list(db.DEFAULT_PRODUCTS.values())
+    now = datetime.now()
+    sales, lines = [], []
+    with db.connection() as conn:
+        conn.execute('DELETE FROM sale_items')
+        conn.execute('DELETE FROM sales')
+        for sale_id in range(1, count + 1):
+            when = now - timedelta(seconds=rng.randint(0, 400 * 86400))
+            total = 0
+            for p in rng.sample(products, rng.randint(1, 4)):
+                qty = rng.randint(1, 3)
+                final_price = round(p['price'] * (1 - p['discount'] / 100), 2)
+                total += final_price * qty
+                lines.append((sale_id, p['id'], p['name'], p['category'], qty, p['price'], final_price))
+            sales.append((sale_id, when.isoformat(), when.timestamp(), total))
+            if len(sales) == 50_000 or sale_id == count:
+                conn.executemany("INSERT INTO sales (id, timestamp, ts_epoch, total, items) VALUES (?, ?, ?, ?, '[]')", sales)
+                conn.executemany(db.SALE_ITEM_INSERT, lines)
+                sales, lines = [], []
+        conn.commit()
+    db.rebuild_rollups()
+
+def legacy_dashboard(sales_history, now, end_dt):
+    """The pre-rollup endpoint (without its mock categories): one walk of the full history per number."""
+    today_str = now.strftime("%Y-%m-%d")
+    yesterday_str = (now - timedelta(days=1)).strftime("%Y-%m-%d")
+
+    today_sales = sum(o.get('total', 0) for o in sales_history if str(o.get('timestamp', '')).startswith(today_str))
+    today_orders_count = len([o for o in sales_history if str(o.get('timestamp', '')).startswith(today_str)])
+    yesterday_sales = sum(o.get('total', 0) for o in sales_history if str(o.get('timestamp', '')).startswith(yesterday_str))
+    trend_pct = 0
+    if yesterday_sales > 0:
+        trend_pct = round(((today_sales - yesterday_sales) / yesterday_sales) * 100)
+
+    end_date_str = end_dt.strftime("%Y-%m-%d")
+    daily_map = {}
+    for i in range(6, -1, -1):
+        d = end_dt - timedelta(days=i)
+        day_str = d.strftime("%Y-%m-%d")
+        is_end_day = (day_str == end_date_str)
+        is_today = (day_str == today_str)
+        label = "Today" if is_today else ("Selected day" if is_end_day and not is_today else d.strftime("%a %d"))
+        daily_map[day_str] = {"date": day_str, "amount": 0, "label": label}
+    for o in sales_history:
+        ts = str(o.get('timestamp', ''))[:10]
+        if ts in daily_map:
+            daily_map[ts]["amount"] += o.get('total', 0)
+    daily_sales = sorted(daily_map.values(), key=lambda x: x["date"])
+    for d in daily_sales:
+        d["date"] = "Today" if d["date"] == today_str else datetime.strptime(d["date"], "%Y-%m-%d").strftime("%a %d")
+
+    sales_by_hour = {h: 0 for h in range(8, 23)}
+    for o in sales_history:
+        if str(o.get('timestamp', '')).startswith(today_str):
+            h = datetime.fromisoformat(o.get('timestamp')).hour
+            if 8 <= h <= 22:
+                sales_by_hour[h] += o.get('total', 0)
+    hourly_sales = [{"hour": f"{h:02d}:00", "amount": sales_by_hour[h]} for h in range(8, 23)]
+
+    monthly_map = {}
+    for order in sales_history:
+        date_obj = datetime.fromisoformat(order.get('timestamp', ''))
+        month_key = (date_obj.year, date_obj.month)
+        monthly_map[month_key] = monthly_map.get(month_key, 0) + order.get('total', 0)
+    monthly_sales = []
+    for i in range(12):
+        month = now.month - 1 - i
+        year = now.year
+        while month <= 0:
+            month += 12
+            year -= 1
+        monthly_sales.append({"month": datetime(year, month, 1).strftime("%b %Y"), "amount": monthly_map.get((year, month), 0)})
+    monthly_sales.reverse()
+
+    weekly_map = {}
+    for order in sales_history:
+        year, week, _ = datetime.fromisoformat(order.get('timestamp', '')).isocalendar()
+        weekly_map[(year, week)] = weekly_map.get((year, week), 0) + order.get('total', 0)
+    weekly_sales = []
+    for i in range(7, -1, -1):
+        d = now - timedelta(weeks=i)
+        year, week, _ = d.isocalendar()
+        monday = d - timedelta(days=d.weekday())
+        weekly_sales.append({"week": "This week" if i == 0 else monday.strftime("%d %b"), "amount": weekly_map.get((year, week), 0)})
+
+    category_totals = {}
+    for order in sales_history:
+        for item in order.get('items', []):
+            cat = item.get('category') or analytics.UNCATEGORISED
+            category_totals[cat] = category_totals.get(cat, 0) + item.get('final_price', item.get('price', 0)) * item.get('qty', 1)
+    total_cat_sum = sum(category_totals.values())
+    category_data = [{"category": cat, "amount": amount,
+                      "percentage": round((amount / total_cat_sum) * 100, 1) if total_cat_sum > 0 else 0}
+                     for cat, amount in sorted(category_totals.items())]
+    category_data.sort(key=lambda x: x['percentage'], reverse=True)
+
+    return {
+        "today_sales": today_sales,
+        "today_orders": today_orders_count,
+        "trend_pct": trend_pct,
+        "daily_sales": daily_sales,
+        "hourly_sales": hourly_sales,
+        "weekly_sales": weekly_sales,
+        "monthly_sales": monthly_sales,
+        "category_sales": category_data
+    }
+
+def rounded(result):
+    """JSON of a dashboard with amounts rounded to paise (the paths add the same floats in different orders)."""
+    def fix(value):
+        if isinstance(value, float):
+            return round(value, 2)
+        if isinstance(value, dict):
+            return {k: fix(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [fix(v) for v in value]
+        return value
+    return json.dumps(fix(result), sort_keys=True)
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def run(count):
+    _, seed_time = timed(lambda: seed_sales(count))
+    now = datetime.now()
+    print(f"{count:,} sales seeded in {seed_time:.1f} s")
+
+    history, load_time = timed(db.get_sales_history)
+    legacy, legacy_time = timed(lambda: legacy_dashboard(history, now, now))
+    scan, scan_time = timed(lambda: analytics.build_dashboard(analytics.SalesScan(history), now, now))
+    del history
+    streamed, stream_time = timed(lambda: analytics.build_dashboard(analytics.SalesScan(db.iter_sales()), now, now))
+    rollup, rollup_time = timed(lambda: analytics.build_dashboard(analytics.RollupSource(), now, now))
+    columns = analytics.ColumnarSource() if analytics.np is not None else None
+    if columns is not None:
+        _, columns_load = timed(columns.refresh)
+        numpy_result, numpy_time = timed(lambda: analytics.build_dashboard(columns, now, now))
+
+    print(f"  load get_sales_history()               | {load_time:8.2f} s")
+    print(f"  multi-pass over the loaded history     | {legacy_time:8.2f} s")
+    print(f"  single pass over the loaded history    | {scan_time:8.2f} s  {legacy_time / scan_time:6.1f}x")
+    print(f"  single pass streamed from iter_sales() | {stream_time:8.2f} s  "
+          f"{(load_time + legacy_time) / stream_time:6.1f}x vs load + multi-pass")
+    print(f"  rollups (what the endpoint reads)      | {rollup_time * 1000:8.2f} ms {(load_time + legacy_time) / rollup_time:6.0f}x")
+    if columns is not None:
+        print(f"  NumPy columns: initial load            | {columns_load:8.2f} s")
+        print(f"  NumPy columns: dashboard               | {numpy_time * 1000:8.2f} ms {(load_time + legacy_time) / numpy_time:6.0f}x")
+        month_ago = now - timedelta(days=30)
+        for label, start in (("all time", None), ("last 30 days", month_ago)):
+            sql_result, sql_top = timed(lambda: db.get_top_products(20, start))
+            numpy_top, columns_top = timed(lambda: columns.top_products(20, start))
+            print(f"  top products, {label + ':':13} SQL {sql_top * 1000:.1f} ms, NumPy {columns_top * 1000:.1f} ms, "
+                  f"same {numpy_top == sql_result}")
+    print(f"  same JSON as multi-pass (to the paisa): single pass {rounded(scan) == rounded(legacy)}, "
+          f"streamed {rounded(streamed) == rounded(legacy)}, rollups {rounded(rollup) == rounded(legacy)}"
+          + (f", numpy {rounded(numpy_result) == rounded(legacy)}" if columns is not None else "") + "\n")
+
+if __name__ == "__main__":
+    counts = [int(n) for n in sys.argv[1:]] or SALE_COUNTS
+
+    print(f"Database: {db.DB_FILE}\n")
+    for count in counts:
+        run(count)
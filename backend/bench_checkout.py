@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Benchmark db.record_sale: checkout latency for baskets of 1, 50 and 500 lines
+# while several trolleys check out concurrently. Runs against a throwaway
+# database unless DB_FILE is set.
+#   python bench_checkout.py [threads] [checkouts_per_thread]
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench_checkout.db"))
+
+import db
+
+BASKET_SIZES = [1, 50, 500]
+CATALOG_SIZE = 500
+
+def seed_catalog():
+    db.init_db()
+    with db.connection() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO products (id, name, unit, price, stock, category, image, discount) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(f"BENCH{i:04d}", f"Bench Item {i}", "1 pc", 10 + i % 90, 10**9, "Bench", "", i % 3 * 5) for i in range(CATALOG_SIZE)]
+        )
+        conn.commit()
+    db.invalidate_catalog()
+
+def make_basket(size, offset):
+    products = db.get_all_products()
+    pids = [f"BENCH{(offset + i) % CATALOG_SIZE:04d}" for i in range(size)]
+    basket = {}
+    for pid in pids:
+        p = products[pid]
+        basket[pid] = {
+            "id": pid,
+            "name": p['name'],
+            "price": p['price'],
+            "discount": p['discount'],
+            "category": p['category'],
+            "final_price": round(p['price'] * (1 - p['discount'] / 100), 2),
+            "qty": 1 + len(basket) % 3
+        }
+    return basket
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run(size, threads, per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n):
+        basket = make_basket(size, n * 7)
+        total = sum(i['final_price'] * i['qty'] for i in basket.values())
+        local = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            db.record_sale(f"BENCH-T{n:03d}", basket, total)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    wall = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - wall
+
+    ms = [l * 1000 for l in latencies]
+    print(f"{size:>5} lines | {len(ms):>4} checkouts | p50 {percentile(ms, 50):7.2f} ms | "
+          f"p95 {percentile(ms, 95):7.2f} ms | max {max(ms):7.2f} ms | {len(ms) / wall:7.1f} checkouts/s")
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+
+    print(f"Database: {db.DB_FILE}")
+    print(f"{threads} concurrent trolleys, {per_thread} checkouts each\n")
+    seed_catalog()
+    for size in BASKET_SIZES:
+        run(size, threads, per_thread)
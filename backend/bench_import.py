@@ -0,0 +1,48 @@
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+# Benchmark the worker bulk import: POST a CSV of N products to
+# /api/worker/import-products, first as fresh inserts and then again as updates
+# of the same ids. Runs against a throwaway database unless DB_FILE is set.
+#   python bench_import.py [rows ...]
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench_import.db"))
+os.environ.setdefault("DISABLE_AUDIT_LOG", "1")
+
+import db
+from app import app
+
+ROW_COUNTS = [10_000, 100_000]
+
+def make_csv(rows, price_offset=0):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['id', 'name', 'unit', 'price', 'stock', 'category', 'discount'])
+    for i in range(rows):
+        writer.writerow([f"IMP{i:06d}", f"Import Item {i}", "1 pc", 10 + (i + price_offset) % 90, 100, "Import", i % 4 * 5])
+    return buf.getvalue().encode('utf-8')
+
+def run(client, rows):
+    for label, offset in (("insert", 0), ("update", 7)):
+        body = make_csv(rows, offset)
+        start = time.perf_counter()
+        res = client.post('/api/worker/import-products', data=body, content_type='text/csv')
+        elapsed = time.perf_counter() - start
+        result = res.get_json()
+        assert res.status_code == 200 and result['imported'] == rows, result.get('message')
+        print(f"{rows:>7} rows | {label} | {elapsed:7.2f} s | {rows / elapsed:9.0f} rows/s")
+
+if __name__ == "__main__":
+    counts = [int(n) for n in sys.argv[1:]] or ROW_COUNTS
+
+    print(f"Database: {db.DB_FILE}\n")
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['worker_logged_in'] = True
+        sess['worker_username'] = 'bench'
+    for rows in counts:
+        run(client, rows)
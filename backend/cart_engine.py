@@ -0,0 +1,192 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# In-memory cart engine (config.CART_ENGINE = "memory"). Live carts are kept in
+# a dict and every change is appended to a JSONL journal (flushed to the OS, not
+# fsynced) before the call returns; a background thread writes the carts that
+# changed to SQLite every `flush_interval` seconds. Journal lines hold absolute
+# quantities, so replaying them over whatever SQLite already has is safe: on
+# restart the cart table is loaded, both journal files are replayed on top and
+# the result is written back before serving.
+#
+# Each flush first moves the journal aside to `<journal>.flushing` and deletes
+# it once SQLite has committed; if the commit fails the file is kept and the
+# next flush appends to it.
+
+class MemoryCartEngine:
+    """Live carts as {trolley_id: {product_id: qty}} with a write-behind journal."""
+
+    def __init__(self, journal_path, persist, flush_interval=2.0):
+        self.journal_path = journal_path
+        self.flushing_path = journal_path + ".flushing"
+        self.persist = persist  # called with {trolley_id: {product_id: qty}} of changed carts
+        self.flush_interval = flush_interval
+        self._carts = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._journal = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush_ms = None
+
+    # --- Recovery ---
+    def load(self, rows):
+        """Start from (trolley_id, product_id, qty) rows read from SQLite and replay the journals."""
+        with self._lock:
+            self._carts = {}
+            for trolley_id, pid, qty in rows:
+                self._carts.setdefault(trolley_id, {})[pid] = qty
+            replayed = 0
+            for path in (self.flushing_path, self.journal_path):
+                replayed += self._replay(path)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            return replayed
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn last line from a crash
+                trolley_id = entry['t']
+                if 'p' in entry:
+                    self._set(trolley_id, entry['p'], entry['q'])
+                else:
+                    self._carts.pop(trolley_id, None)
+                self._dirty.add(trolley_id)
+                count += 1
+        return count
+
+    # --- Cart operations (callers stamp versions/totals) ---
+    def _set(self, trolley_id, pid, qty):
+        cart = self._carts.setdefault(trolley_id, {})
+        if qty > 0:
+            cart[pid] = qty
+        else:
+            cart.pop(pid, None)
+            if not cart:
+                del self._carts[trolley_id]
+
+    def _log(self, entries):
+        self._journal.write(''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in entries))
+        self._journal.flush()
+
+    def add(self, counts):
+        """counts: {(trolley_id, product_id): qty to add}"""
+        with self._lock:
+            entries = []
+            for (trolley_id, pid), qty in counts.items():
+                new_qty = self._carts.get(trolley_id, {}).get(pid, 0) + qty
+                self._set(trolley_id, pid, new_qty)
+                self._dirty.add(trolley_id)
+                entries.append({"t": trolley_id, "p": pid, "q": new_qty})
+            self._log(entries)
+
+    def remove_one(self, trolley_id, pid):
+        """Take one unit out of the cart. False if it was not there."""
+        with self._lock:
+            qty = self._carts.get(trolley_id, {}).get(pid, 0)
+            if qty <= 0:
+                return False
+            self._set(trolley_id, pid, qty - 1)
+            self._dirty.add(trolley_id)
+            self._log([{"t": trolley_id, "p": pid, "q": qty - 1}])
+            return True
+
+    def clear(self, trolley_id):
+        with self._lock:
+            self._carts.pop(trolley_id, None)
+            self._dirty.add(trolley_id)
+            self._log([{"t": trolley_id}])
+
+    def drop_product(self, pid):
+        """Remove a deleted product from every cart."""
+        with self._lock:
+            entries = []
+            for trolley_id in [t for t, cart in self._carts.items() if pid in cart]:
+                self._set(trolley_id, pid, 0)
+                self._dirty.add(trolley_id)
+                entries.append({"t": trolley_id, "p": pid, "q": 0})
+            if entries:
+                self._log(entries)
+
+    def items(self, trolley_id):
+        """{product_id: qty} copy of one cart."""
+        with self._lock:
+            return dict(self._carts.get(trolley_id, {}))
+
+    def active_count(self):
+        with self._lock:
+            return len(self._carts)
+
+    # --- Write-behind ---
+    def flush(self):
+        """Write every changed cart to SQLite. True if nothing is left pending."""
+        with self._flush_lock:
+            start = time.perf_counter()
+            with self._lock:
+                if not self._dirty:
+                    return True
+                snapshot = {t: dict(self._carts.get(t, {})) for t in self._dirty}
+                self._dirty = set()
+                # Lines written from here on go to a fresh journal
+                self._journal.close()
+                if os.path.exists(self.flushing_path):
+                    with open(self.journal_path, encoding='utf-8') as src, \
+                            open(self.flushing_path, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self.flushing_path)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            try:
+                self.persist(snapshot)
+            except Exception as e:
+                print(f"Cart flush error ({len(snapshot)} carts kept in the journal): {e}")
+                with self._lock:
+                    self._dirty |= snapshot.keys()
+                    self.flush_errors += 1
+                return False
+            os.remove(self.flushing_path)
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+            return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cart-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the flusher and write out whatever is still pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            journal_bytes = self._journal.tell() if self._journal else 0
+            return {
+                "carts": len(self._carts),
+                "dirty": len(self._dirty),
+                "journal_bytes": journal_bytes,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "last_flush_ms": self.last_flush_ms
+            }
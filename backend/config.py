@@ -3,6 +3,31 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-DEBUG = True
+DEBUG = os.environ.get("FLASK_DEBUG", "1") == "1"  # 0 under systemd: no reloader process, so SIGTERM reaches the app
 PORT = 5000
 HOST = '0.0.0.0'
+
+# --- Database ---
+DB_FILE = os.environ.get("DB_FILE", os.path.join(os.path.dirname(__file__), "database.db"))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))              # idle connections kept per process
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000)) # wait for the writer lock instead of failing
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 8192))   # page cache per connection
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 64 * 1024 * 1024))
+DB_WRITE_RETRIES = int(os.environ.get("DB_WRITE_RETRIES", 3))            # extra attempts when checkout still finds the DB locked
+DB_WRITE_RETRY_DELAY = float(os.environ.get("DB_WRITE_RETRY_DELAY", 0.05)) # seconds, doubled per attempt
+
+# --- Trolleys ---
+DEFAULT_TROLLEY_ID = os.environ.get("DEFAULT_TROLLEY_ID", "T01")  # used when a client does not send trolley_id
+RFID_BATCH_MAX = int(os.environ.get("RFID_BATCH_MAX", 100))  # scans accepted per /rfid/batch request
+RFID_DEDUP_WINDOW = float(os.environ.get("RFID_DEDUP_WINDOW", 2.0))  # seconds a tag must be out of sight before it counts again, 0 disables
+RFID_INGEST_MODE = os.environ.get("RFID_INGEST_MODE", "sync")  # "async": /rfid enqueues and replies 202, one writer thread applies scans
+SSE_KEEPALIVE_SECONDS = int(os.environ.get("SSE_KEEPALIVE_SECONDS", 15))  # idle /cart/stream sends a comment this often
+TROLLEY_IDLE_AFTER = int(os.environ.get("TROLLEY_IDLE_AFTER", 60))             # seconds without a heartbeat before Online -> Idle
+TROLLEY_ABANDONED_AFTER = int(os.environ.get("TROLLEY_ABANDONED_AFTER", 300))   # Idle -> Abandoned
+TROLLEY_EVICT_AFTER = int(os.environ.get("TROLLEY_EVICT_AFTER", 3600))          # Abandoned sessions are dropped after this
+CART_ENGINE = os.environ.get("CART_ENGINE", "sqlite")  # "memory": live carts in RAM, journaled and written behind to SQLite
+CART_JOURNAL_FILE = os.environ.get("CART_JOURNAL_FILE", DB_FILE + ".carts.jsonl")  # replayed on restart in memory mode
+CART_FLUSH_INTERVAL = float(os.environ.get("CART_FLUSH_INTERVAL", 2.0))  # seconds between write-behind flushes
+
+# --- Analytics ---
+ANALYTICS_BACKEND = os.environ.get("ANALYTICS_BACKEND", "rollup")  # "numpy": dashboard from in-memory NumPy columns (falls back to rollup without NumPy)
@@ -1,9 +1,18 @@
+import atexit
 import sqlite3
 import json
-import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
-DB_FILE = os.path.join(os.path.dirname(__file__), "database.db")
+from flask import g, has_app_context
+
+import cart_engine
+import config
+
+DB_FILE = config.DB_FILE
 
 DEFAULT_PRODUCTS = {
     "03563B38": {"id": "03563B38", "name": "Milk Packet",    "unit": "500 ml", "price": 25,  "stock": 40, "category": "Dairy",    "image": "/customer-frontend/static/images/milk_packet.png", "discount": 0},
@@ -16,16 +25,94 @@ DEFAULT_PRODUCTS = {
     "E3F72C39": {"id": "E3F72C39", "name": "Aashirvaad Atta", "unit": "1 kg",   "price": 45,  "stock": 22, "category": "Grains",   "image": "/customer-frontend/static/images/aashirvaad_atta.png", "discount": 0}
 }
 
+# --- Connection Management ---
+# Connections are expensive to open on the Pi's SD card, so idle ones are kept in a
+# small per-process pool. Inside a Flask request the first helper that needs the
+# database checks one out and every later helper in the same request reuses it;
+# app.py hands it back to the pool on teardown.
+_pool = queue.LifoQueue(maxsize=config.DB_POOL_SIZE)
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+    """Open a new tuned connection (WAL, so readers never block the checkout writer)."""
+    conn = sqlite3.connect(DB_FILE, timeout=config.DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')  # durable in WAL mode, one fsync per checkpoint
+    conn.execute(f'PRAGMA cache_size = -{config.DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {config.DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout = {config.DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store = MEMORY')
     return conn
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
+def acquire_connection():
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return get_db_connection()
+
+def release_connection(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def connection():
+    """
+    Yield a pooled connection. Within an app context the connection is cached on
+    flask.g so one request does at most one checkout from the pool.
+    """
+    if has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = g._db_conn = acquire_connection()
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        return
 
-    # Create Tables
+    conn = acquire_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+def close_request_connection(exc=None):
+    """teardown_appcontext hook: return the request's connection to the pool."""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        release_connection(conn)
+
+def close_all_connections():
+    """Close every idle pooled connection (the last one closed checkpoints the WAL)."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+# Registered before anything that flushes on exit, so it runs after them
+atexit.register(close_all_connections)
+
+# --- Schema Migrations ---
+# PRAGMA user_version records how many of MIGRATIONS have been applied. init_db
+# applies only the pending ones, all in one transaction, and does nothing else
+# on an up-to-date database. Migrations must stay idempotent against databases
+# created before the runner existed (user_version 0 with tables already present).
+# Append new migrations to the end of the list; never reorder or edit old ones.
+
+def _add_column_if_missing(c, table, column, decl):
+    columns = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+def _migrate_base_schema(c):
+    """Base tables, legacy columns and seed data"""
     c.execute('''CREATE TABLE IF NOT EXISTS products (
                     id TEXT PRIMARY KEY,
                     name TEXT NOT NULL,
@@ -39,18 +126,10 @@ def init_db():
                     promotion_description TEXT,
                     promotion_expiry TEXT
                 )''')
-
-    # Migration: Add last_updated column if it doesn't exist
-    try:
-        c.execute('ALTER TABLE products ADD COLUMN last_updated TEXT')
-    except sqlite3.OperationalError:
-        pass # Column already exists
-
-    # Migration: Add discount column if it doesn't exist
-    try:
-        c.execute('ALTER TABLE products ADD COLUMN discount REAL DEFAULT 0')
-    except sqlite3.OperationalError:
-        pass # Column already exists
+    _add_column_if_missing(c, 'products', 'last_updated', 'TEXT')
+    _add_column_if_missing(c, 'products', 'discount', 'REAL DEFAULT 0')
+    _add_column_if_missing(c, 'products', 'promotion_description', 'TEXT')
+    _add_column_if_missing(c, 'products', 'promotion_expiry', 'TEXT')
 
     c.execute('''CREATE TABLE IF NOT EXISTS cart (
                     product_id TEXT PRIMARY KEY,
@@ -74,17 +153,8 @@ def init_db():
                     created_at TEXT,
                     last_shown TEXT  -- Track when this ad was last displayed for rotation
                 )''')
-    
-    # Migration: Add created_at and last_shown columns if they don't exist
-    try:
-        c.execute('ALTER TABLE promotions ADD COLUMN created_at TEXT')
-    except sqlite3.OperationalError:
-        pass
-    
-    try:
-        c.execute('ALTER TABLE promotions ADD COLUMN last_shown TEXT')
-    except sqlite3.OperationalError:
-        pass
+    _add_column_if_missing(c, 'promotions', 'created_at', 'TEXT')
+    _add_column_if_missing(c, 'promotions', 'last_shown', 'TEXT')
 
     c.execute('''CREATE TABLE IF NOT EXISTS ui_settings (
                     key TEXT PRIMARY KEY,
@@ -101,54 +171,456 @@ def init_db():
         "promo_banner_text": "Welcome to Smart Trolley!",
         "promo_banner_image": "" 
     }
-    
-    for k, v in defaults.items():
-        c.execute('INSERT OR IGNORE INTO ui_settings (key, value) VALUES (?, ?)', (k, v))
+    c.executemany('INSERT OR IGNORE INTO ui_settings (key, value) VALUES (?, ?)', defaults.items())
 
     # Seed Data if empty
-    c.execute('SELECT count(*) FROM products')
-    if c.fetchone()[0] == 0:
+    if c.execute('SELECT count(*) FROM products').fetchone()[0] == 0:
         print("Seeding database with default products...")
         curr_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        for pid, p in DEFAULT_PRODUCTS.items():
-            c.execute('INSERT INTO products (id, name, unit, price, stock, category, image, last_updated, discount, promotion_description, promotion_expiry) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                      (p['id'], p['name'], p['unit'], p['price'], p['stock'], p['category'], p['image'], curr_time, p.get('discount', 0), p.get('promotion_description', ''), p.get('promotion_expiry', '')))
-    
-    conn.commit()
-    conn.close()
+        c.executemany('INSERT INTO products (id, name, unit, price, stock, category, image, last_updated, discount, promotion_description, promotion_expiry) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                      [(p['id'], p['name'], p['unit'], p['price'], p['stock'], p['category'], p['image'], curr_time, p.get('discount', 0), p.get('promotion_description', ''), p.get('promotion_expiry', ''))
+                       for p in DEFAULT_PRODUCTS.values()])
+
+def _migrate_sale_items(c):
+    """sale_items table, backfilled from the sales.items JSON blob"""
+    # One row per basket line; replaces the JSON blob in sales.items for reporting
+    c.execute('''CREATE TABLE IF NOT EXISTS sale_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sale_id INTEGER NOT NULL,
+                    product_id TEXT,
+                    name TEXT,
+                    category TEXT,
+                    qty INTEGER NOT NULL,
+                    unit_price REAL NOT NULL,
+                    final_price REAL NOT NULL,
+                    FOREIGN KEY (sale_id) REFERENCES sales (id)
+                )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items (sale_id)')
+    _backfill_sale_items(c)
+
+def _migrate_sales_epoch(c):
+    """Indexed numeric sales timestamps"""
+    # Numeric (unix epoch) copy of sales.timestamp for indexed range scans
+    _add_column_if_missing(c, 'sales', 'ts_epoch', 'REAL')
+    _backfill_sales_epoch(c)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sales_ts_epoch ON sales (ts_epoch)')
+
+def _migrate_sales_rollups(c):
+    """Hourly/daily/monthly sales rollups"""
+    # Pre-aggregated sales per hour/day/month, maintained by record_sale
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_rollup (
+                    period TEXT NOT NULL,  -- 'hour', 'day' or 'month'
+                    bucket TEXT NOT NULL,  -- local time: 'YYYY-MM-DD HH', 'YYYY-MM-DD' or 'YYYY-MM'
+                    revenue REAL DEFAULT 0,
+                    orders INTEGER DEFAULT 0,
+                    items INTEGER DEFAULT 0,
+                    PRIMARY KEY (period, bucket)
+                )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_rollup_category (
+                    period TEXT NOT NULL,  -- 'day' or 'month'
+                    bucket TEXT NOT NULL,
+                    category TEXT NOT NULL,  -- '' for lines sold without a category
+                    revenue REAL DEFAULT 0,
+                    items INTEGER DEFAULT 0,
+                    PRIMARY KEY (period, bucket, category)
+                )''')
+    _rebuild_rollups(c)
+
+def _migrate_trolley_carts(c):
+    """Carts keyed by trolley ID"""
+    # SQLite cannot change a primary key in place, so rebuild the cart table.
+    # Items already in the single shared cart move to the default trolley.
+    columns = {row[1] for row in c.execute('PRAGMA table_info(cart)')}
+    if 'trolley_id' not in columns:
+        c.execute('''CREATE TABLE cart_new (
+                        trolley_id TEXT NOT NULL,
+                        product_id TEXT NOT NULL,
+                        qty INTEGER DEFAULT 1,
+                        PRIMARY KEY (trolley_id, product_id),
+                        FOREIGN KEY (product_id) REFERENCES products (id)
+                    ) WITHOUT ROWID''')
+        c.execute('INSERT INTO cart_new (trolley_id, product_id, qty) SELECT ?, product_id, qty FROM cart',
+                  (config.DEFAULT_TROLLEY_ID,))
+        c.execute('DROP TABLE cart')
+        c.execute('ALTER TABLE cart_new RENAME TO cart')
+    _add_column_if_missing(c, 'sales', 'trolley_id', 'TEXT')
+
+def _migrate_frozen_products(c):
+    """frozen_products table, moved out of the ui_settings JSON list"""
+    c.execute('''CREATE TABLE IF NOT EXISTS frozen_products (
+                    product_id TEXT PRIMARY KEY,
+                    frozen_at TEXT
+                ) WITHOUT ROWID''')
+    row = c.execute("SELECT value FROM ui_settings WHERE key = 'frozen_products'").fetchone()
+    if row:
+        try:
+            pids = json.loads(row['value'] or '[]')
+        except ValueError:
+            pids = []
+        c.executemany('INSERT OR IGNORE INTO frozen_products (product_id, frozen_at) VALUES (?, ?)',
+                      [(str(pid), None) for pid in pids])
+        c.execute("DELETE FROM ui_settings WHERE key = 'frozen_products'")
+
+def _migrate_sale_item_categories(c):
+    """Category on historic sale lines, from the product catalog"""
+    # Checkouts used to write sale lines without a category. Fill them in from
+    # the product's current category where it still exists, then rebuild the
+    # category rollups from the repaired lines.
+    c.execute('''
+        UPDATE sale_items SET category = (SELECT p.category FROM products p WHERE p.id = sale_items.product_id)
+        WHERE category IS NULL
+          AND EXISTS (SELECT 1 FROM products p WHERE p.id = sale_items.product_id AND p.category IS NOT NULL)
+    ''')
+    _rebuild_rollups(c)
+
+def _migrate_product_rollup(c):
+    """All-time sales per product"""
+    # One row per product, maintained by record_sale, so the unbounded top
+    # products report reads a handful of rows instead of every sale line
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_rollup_product (
+                    product_key TEXT PRIMARY KEY,  -- product id, else the line name ('' if neither)
+                    product_id TEXT,
+                    name TEXT,  -- name on the newest sale line
+                    quantity INTEGER DEFAULT 0,
+                    revenue REAL DEFAULT 0
+                )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sales_rollup_product_revenue ON sales_rollup_product (revenue)')
+    _rebuild_product_rollup(c)
+
+MIGRATIONS = [
+    _migrate_base_schema,    # 1
+    _migrate_sale_items,     # 2
+    _migrate_sales_epoch,    # 3
+    _migrate_sales_rollups,  # 4
+    _migrate_trolley_carts,  # 5
+    _migrate_frozen_products,  # 6
+    _migrate_sale_item_categories,  # 7
+    _migrate_product_rollup,  # 8
+]
+
+def init_db():
+    with connection() as conn:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        # Re-read under the write lock: another worker may have just migrated
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number in range(version + 1, len(MIGRATIONS) + 1):
+            migration = MIGRATIONS[number - 1]
+            print(f"Applying database migration {number}: {migration.__doc__}")
+            migration(conn)
+        conn.execute(f'PRAGMA user_version = {max(version, len(MIGRATIONS))}')
+        conn.commit()
+
+def _sale_item_rows(sale_id, items):
+    return [(sale_id, item.get('id'), item.get('name'), item.get('category'), item.get('qty', 1),
+             item.get('price', 0), item.get('final_price', item.get('price', 0)))
+            for item in items]
+
+def _to_epoch(value):
+    """datetime, ISO string or epoch seconds -> epoch seconds (naive datetimes are local time)."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+def _backfill_sales_epoch(c):
+    rows = c.execute('SELECT id, timestamp FROM sales WHERE ts_epoch IS NULL').fetchall()
+    updates = []
+    for sale_id, timestamp in rows:
+        try:
+            updates.append((_to_epoch(timestamp), sale_id))
+        except (TypeError, ValueError):
+            continue
+    c.executemany('UPDATE sales SET ts_epoch = ? WHERE id = ?', updates)
+
+def _backfill_sale_items(c):
+    legacy = c.execute('''
+        SELECT s.id, s.items FROM sales s
+        WHERE s.items != '[]'
+          AND NOT EXISTS (SELECT 1 FROM sale_items si WHERE si.sale_id = s.id)
+    ''').fetchall()
+    if not legacy:
+        return
+
+    print(f"Migrating {len(legacy)} sales to sale_items...")
+    for sale_id, items_json in legacy:
+        try:
+            items = json.loads(items_json)
+        except (TypeError, ValueError):
+            continue
+        c.executemany(SALE_ITEM_INSERT, _sale_item_rows(sale_id, items))
+
+# --- Product Catalog Cache ---
+# The catalog only changes when staff edit it or a checkout decrements stock, so
+# product rows are served from memory. Every write helper below updates the cache
+# after its commit and bumps the version. Rows are replaced, never mutated in
+# place, so readers can hold on to a row without locking. The cache is per
+# process: edits made by another process are not seen until restart.
+_catalog = None  # {uid: product dict}, loaded on first use
+_catalog_version = 0
+_pricing_version = 0  # only bumped when a price or discount may have changed
+_catalog_lock = threading.Lock()
+
+def _get_catalog():
+    # Read the global once: invalidate_catalog() may reset it at any moment
+    global _catalog
+    catalog = _catalog
+    if catalog is None:
+        with _catalog_lock:
+            catalog = _catalog
+            if catalog is None:
+                with connection() as conn:
+                    rows = conn.execute('SELECT * FROM products').fetchall()
+                catalog = _catalog = {r['id']: dict(r) for r in rows}
+    return catalog
+
+def _catalog_put(conn, pids):
+    """Re-read the given products after a write and publish them to the cache."""
+    global _catalog_version, _pricing_version
+    rows = None
+    if _catalog is not None:  # nothing to refresh while unloaded
+        placeholders = ', '.join('?' * len(pids))
+        rows = {r['id']: dict(r) for r in conn.execute(f'SELECT * FROM products WHERE id IN ({placeholders})', list(pids))}
+    with _catalog_lock:
+        catalog = _catalog
+        if catalog is None or rows is None:
+            # Unloaded (or reloaded from scratch since the check): the next read sees the write
+            _catalog_version += 1
+            _pricing_version += 1
+            return
+        repriced = False
+        for pid in pids:
+            old = catalog.get(pid)
+            if pid in rows:
+                catalog[pid] = rows[pid]
+                new = rows[pid]
+                repriced = repriced or (old is not None and (old['price'], old['discount']) != (new['price'], new['discount']))
+            else:
+                catalog.pop(pid, None)
+                repriced = True
+        _catalog_version += 1
+        if repriced:
+            _pricing_version += 1
+
+def _catalog_remove(pid):
+    global _catalog_version, _pricing_version
+    with _catalog_lock:
+        if _catalog is not None:
+            _catalog.pop(pid, None)
+        _catalog_version += 1
+        _pricing_version += 1
+
+def catalog_version():
+    """Increases whenever a product is added, edited, deleted or sold."""
+    return _catalog_version
+
+def invalidate_catalog():
+    global _catalog, _catalog_version, _pricing_version
+    with _catalog_lock:
+        _catalog = None
+        _catalog_version += 1
+        _pricing_version += 1
 
 # --- Product Helpers ---
 def get_all_products():
-    conn = get_db_connection()
-    products = conn.execute('SELECT * FROM products').fetchall()
-    conn.close()
-    return {p['id']: dict(p) for p in products}
+    catalog = _get_catalog()
+    with _catalog_lock:
+        return {pid: dict(p) for pid, p in catalog.items()}
 
 def get_product(pid):
-    conn = get_db_connection()
-    product = conn.execute('SELECT * FROM products WHERE id = ?', (pid,)).fetchone()
-    conn.close()
+    product = _get_catalog().get(pid)
     return dict(product) if product else None
 
 def update_stock(pid, qty_change):
     """
     qty_change: negative to reduce stock, positive to increase
     """
-    conn = get_db_connection()
-    conn.execute('UPDATE products SET stock = stock + ? WHERE id = ?', (qty_change, pid))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute('UPDATE products SET stock = stock + ? WHERE id = ?', (qty_change, pid))
+        conn.commit()
+        _catalog_put(conn, [pid])
+
+# --- Cart Versions and Totals ---
+# Every cart write stamps the trolley with the next value of a per-process
+# counter, after its commit. Together with catalog_version() (prices, deletes)
+# this tells /cart and the heartbeat whether a cart can have changed without
+# reading it.
+# Next to the version each trolley keeps running totals (item count, gross and
+# net in paise) that the same writes adjust by the unit prices of the products
+# they touched, so reading them is a dict lookup. Totals are folded from the
+# cart rows on first read, and again after a price or discount has changed. A
+# read that overlaps a write returns totals folded from what it read but does
+# not cache them.
+_cart_seq = 0
+_carts = {}  # {trolley_id: {'version', 'item_count', 'gross', 'net', 'pricing'}}; item_count None = not known
+_cart_writers = {}  # {trolley_id: writes between begin and stamp}
+_cart_lock = threading.Lock()
+
+def _unit_paise(product):
+    """(gross, net) price of one unit in paise, rounded the way get_cart_items bills it."""
+    price = product['price']
+    discount = product['discount'] or 0
+    return round(price * 100), round(round(price * (1 - discount / 100), 2) * 100)
+
+def _fold_totals(cart_items):
+    totals = {'item_count': 0, 'gross': 0, 'net': 0}
+    for item in cart_items.values():
+        gross, net = _unit_paise(item)
+        totals['item_count'] += item['qty']
+        totals['gross'] += gross * item['qty']
+        totals['net'] += net * item['qty']
+    return totals
+
+@contextmanager
+def _cart_write(trolley_ids):
+    """Wrap a cart write so overlapping reads know not to cache their totals."""
+    trolley_ids = set(trolley_ids)
+    with _cart_lock:
+        for trolley_id in trolley_ids:
+            _cart_writers[trolley_id] = _cart_writers.get(trolley_id, 0) + 1
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        with _cart_lock:
+            for trolley_id in trolley_ids:
+                _cart_writers[trolley_id] -= 1
+                if not _cart_writers[trolley_id]:
+                    del _cart_writers[trolley_id]
+                if not ok and trolley_id in _carts:
+                    _carts[trolley_id]['item_count'] = None  # may or may not have committed
+
+def _cart_written(deltas=None, emptied=()):
+    """Stamp and re-total carts after a commit.
+
+    deltas: {(trolley_id, product_id): qty change}; emptied: trolleys whose cart is now empty.
+    """
+    global _cart_seq
+    deltas = deltas or {}
+    catalog = _get_catalog()
+    units = {pid: _unit_paise(catalog[pid]) if pid in catalog else None for _, pid in deltas}
+    with _cart_lock:
+        _cart_seq += 1
+        for trolley_id in emptied:
+            _carts[trolley_id] = {'version': _cart_seq, 'item_count': 0, 'gross': 0, 'net': 0,
+                                  'pricing': _pricing_version}
+        for (trolley_id, pid), qty in deltas.items():
+            state = _carts.setdefault(trolley_id, {'item_count': None})
+            state['version'] = _cart_seq
+            if state['item_count'] is None:
+                continue
+            if units[pid] is None:
+                state['item_count'] = None  # product vanished, refold on next read
+                continue
+            gross, net = units[pid]
+            state['item_count'] += qty
+            state['gross'] += gross * qty
+            state['net'] += net * qty
+
+def cart_version(trolley_id):
+    """Increases whenever this trolley's cart is written."""
+    state = _carts.get(trolley_id)
+    return state['version'] if state else 0
+
+def _totals_dict(totals):
+    return {
+        "item_count": totals['item_count'],
+        "gross": totals['gross'] / 100,
+        "discount": (totals['gross'] - totals['net']) / 100,
+        "net": totals['net'] / 100
+    }
+
+def _cached_totals(trolley_id):
+    """The trolley's running totals if they are known and current, else None. Call under _cart_lock."""
+    state = _carts.get(trolley_id)
+    if (state is None or state['item_count'] is None or state['pricing'] != _pricing_version
+            or trolley_id in _cart_writers):
+        return None
+    return state
+
+def get_cart(trolley_id):
+    """A trolley's cart items together with the totals of exactly those items."""
+    with _cart_lock:
+        before = (cart_version(trolley_id), _pricing_version, trolley_id in _cart_writers)
+    items = get_cart_items(trolley_id)
+    with _cart_lock:
+        quiet = before == (cart_version(trolley_id), _pricing_version, False) and trolley_id not in _cart_writers
+        state = _cached_totals(trolley_id) if quiet else None
+        if state is None:
+            state = _fold_totals(items)
+            if quiet:
+                _carts[trolley_id] = dict(state, version=before[0], pricing=before[1])
+        return items, _totals_dict(state)
+
+# --- Cart Engine ---
+# With CART_ENGINE = "memory" live carts are held by cart_engine.MemoryCartEngine
+# and the cart table is only written behind (on an interval, and by checkout).
+# The helpers below take the same paths either way for versions and totals.
+_memory_carts = None
+_memory_carts_lock = threading.Lock()
+
+def _persist_carts(carts):
+    """Write-behind target: replace the rows of each given cart in one transaction."""
+    with connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for trolley_id, items in carts.items():
+            conn.execute('DELETE FROM cart WHERE trolley_id = ?', (trolley_id,))
+            conn.executemany('INSERT INTO cart (trolley_id, product_id, qty) VALUES (?, ?, ?)',
+                             [(trolley_id, pid, qty) for pid, qty in items.items()])
+        conn.commit()
+
+def _get_memory_carts():
+    """The in-memory cart engine, recovered from SQLite plus its journal on first use. None with SQLite carts."""
+    global _memory_carts
+    if config.CART_ENGINE != "memory":
+        return None
+    if _memory_carts is None:
+        with _memory_carts_lock:
+            if _memory_carts is None:
+                engine = cart_engine.MemoryCartEngine(config.CART_JOURNAL_FILE, _persist_carts,
+                                                      config.CART_FLUSH_INTERVAL)
+                with connection() as conn:
+                    rows = conn.execute('SELECT trolley_id, product_id, qty FROM cart').fetchall()
+                replayed = engine.load([tuple(r) for r in rows])
+                if replayed:
+                    print(f"Recovered {replayed} cart changes from {config.CART_JOURNAL_FILE}")
+                engine.flush()
+                engine.start()
+                _memory_carts = engine
+    return _memory_carts
+
+def flush_carts():
+    """Write pending in-memory cart changes to SQLite now (no-op with SQLite carts)."""
+    engine = _get_memory_carts()
+    return engine.flush() if engine is not None else True
+
+def cart_engine_stats():
+    engine = _get_memory_carts()
+    return dict(engine.stats() if engine is not None else {}, engine=config.CART_ENGINE)
 
 # --- Cart Helpers ---
-def get_cart_items():
-    conn = get_db_connection()
-    query = '''
-        SELECT c.product_id, c.qty, p.name, p.unit, p.price, p.image, p.discount
-        FROM cart c
-        JOIN products p ON c.product_id = p.id
-    '''
-    items = conn.execute(query).fetchall()
-    conn.close()
+# Every trolley has its own cart, keyed by the device ID it sends with each scan.
+# The (trolley_id, product_id) primary key doubles as the per-trolley index.
+def get_cart_items(trolley_id):
+    engine = _get_memory_carts()
+    if engine is not None:
+        catalog = _get_catalog()
+        items = [dict(catalog[pid], product_id=pid, qty=qty)
+                 for pid, qty in engine.items(trolley_id).items() if pid in catalog]
+    else:
+        query = '''
+            SELECT c.product_id, c.qty, p.name, p.unit, p.price, p.image, p.discount, p.category
+            FROM cart c
+            JOIN products p ON c.product_id = p.id
+            WHERE c.trolley_id = ?
+        '''
+        with connection() as conn:
+            items = conn.execute(query, (trolley_id,)).fetchall()
     
     cart_dict = {}
     for item in items:
@@ -165,68 +637,153 @@ def get_cart_items():
             "discount": discount,
             "final_price": round(final_price, 2), # Use this for billing
             "image": item['image'],
+            "category": item['category'], # Snapshotted onto the sale line at checkout
             "qty": item['qty']
         }
     return cart_dict
 
-def add_to_cart(pid):
-    conn = get_db_connection()
-    # Check if exists
-    exists = conn.execute('SELECT 1 FROM cart WHERE product_id = ?', (pid,)).fetchone()
-    
-    if exists:
-        conn.execute('UPDATE cart SET qty = qty + 1 WHERE product_id = ?', (pid,))
-    else:
-        conn.execute('INSERT INTO cart (product_id, qty) VALUES (?, 1)', (pid,))
-        
-    conn.commit()
-    conn.close()
+def add_to_cart(trolley_id, pid):
+    engine = _get_memory_carts()
+    with _cart_write([trolley_id]):
+        if engine is not None:
+            engine.add({(trolley_id, pid): 1})
+        else:
+            with connection() as conn:
+                conn.execute('''INSERT INTO cart (trolley_id, product_id, qty) VALUES (?, ?, 1)
+                                ON CONFLICT (trolley_id, product_id) DO UPDATE SET qty = qty + 1''',
+                             (trolley_id, pid))
+                conn.commit()
+        _cart_written({(trolley_id, pid): 1})
 
-def remove_from_cart(pid):
-    conn = get_db_connection()
-    item = conn.execute('SELECT qty FROM cart WHERE product_id = ?', (pid,)).fetchone()
-    
-    if item:
-        if item['qty'] > 1:
-            conn.execute('UPDATE cart SET qty = qty - 1 WHERE product_id = ?', (pid,))
+def add_many_to_cart(trolley_id, pids):
+    """Add a batch of scans (repeats allowed) to one trolley's cart in a single transaction."""
+    add_scans_to_cart([(trolley_id, pid) for pid in pids])
+
+def add_scans_to_cart(scans):
+    """Apply (trolley_id, product_id) scans for any number of trolleys in a single transaction."""
+    counts = {}
+    for key in scans:
+        counts[key] = counts.get(key, 0) + 1
+    engine = _get_memory_carts()
+    with _cart_write(trolley_id for trolley_id, _ in counts):
+        if engine is not None:
+            engine.add(counts)
         else:
-            conn.execute('DELETE FROM cart WHERE product_id = ?', (pid,))
-        conn.commit()
-        conn.close()
-        return True
-    
-    conn.close()
-    return False
+            with connection() as conn:
+                conn.executemany('''INSERT INTO cart (trolley_id, product_id, qty) VALUES (?, ?, ?)
+                                    ON CONFLICT (trolley_id, product_id) DO UPDATE SET qty = qty + excluded.qty''',
+                                 [(trolley_id, pid, qty) for (trolley_id, pid), qty in counts.items()])
+                conn.commit()
+        _cart_written(counts)
 
-def clear_cart():
-    conn = get_db_connection()
-    conn.execute('DELETE FROM cart')
-    conn.commit()
-    conn.close()
+def remove_from_cart(trolley_id, pid):
+    engine = _get_memory_carts()
+    with _cart_write([trolley_id]):
+        if engine is not None:
+            removed = engine.remove_one(trolley_id, pid)
+        else:
+            with connection() as conn:
+                cur = conn.execute('UPDATE cart SET qty = qty - 1 WHERE trolley_id = ? AND product_id = ? AND qty > 1',
+                                   (trolley_id, pid))
+                if cur.rowcount == 0:
+                    cur = conn.execute('DELETE FROM cart WHERE trolley_id = ? AND product_id = ?', (trolley_id, pid))
+                conn.commit()
+            removed = cur.rowcount > 0
+        if removed:
+            _cart_written({(trolley_id, pid): -1})
+    return removed
+
+def clear_cart(trolley_id):
+    engine = _get_memory_carts()
+    with _cart_write([trolley_id]):
+        if engine is not None:
+            engine.clear(trolley_id)
+        else:
+            with connection() as conn:
+                conn.execute('DELETE FROM cart WHERE trolley_id = ?', (trolley_id,))
+                conn.commit()
+        _cart_written(emptied=[trolley_id])
+
+def count_active_trolleys():
+    """Number of trolleys with at least one item in their cart."""
+    engine = _get_memory_carts()
+    if engine is not None:
+        return engine.active_count()
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(DISTINCT trolley_id) FROM cart').fetchone()[0]
 
 # --- Sales Helpers ---
-def record_sale(cart_items, total_amount, discount_percent=0):
-    conn = get_db_connection()
-    
-    timestamp = datetime.now().isoformat()
-    items_json = json.dumps(list(cart_items.values()))
+SALE_ITEM_INSERT = '''INSERT INTO sale_items (sale_id, product_id, name, category, qty, unit_price, final_price)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+# Bumped after every committed sale (and rollup rebuild), so reports computed
+# from sales can be cached until the next checkout. Per process, like the
+# catalog cache.
+_sales_version = 0
+_sales_version_lock = threading.Lock()
+
+def _bump_sales_version():
+    global _sales_version
+    with _sales_version_lock:
+        _sales_version += 1
+
+def sales_version():
+    """Increases whenever a sale is recorded."""
+    return _sales_version
+
+def _is_busy(err):
+    """True for SQLITE_BUSY / 'database is locked' errors that are worth retrying."""
+    return 'locked' in str(err) or 'busy' in str(err)
+
+def record_sale(trolley_id, cart_items, total_amount, discount_percent=0):
+    now = datetime.now()
+    timestamp = now.isoformat()
     
     # Apply Discount
     final_total = total_amount * (1 - (discount_percent / 100))
     
-    # Insert Sale
-    conn.execute('INSERT INTO sales (timestamp, total, items) VALUES (?, ?, ?)', 
-                 (timestamp, final_total, items_json))
-    
-    # Update Stock and Last Updated
-    for item in cart_items.values():
-        conn.execute('UPDATE products SET stock = MAX(0, stock - ?), last_updated = ? WHERE id = ?', 
-                     (item['qty'], timestamp, item['id']))
-    
-    # Clear Cart
-    conn.execute('DELETE FROM cart')
+    stock_updates = [(item['qty'], timestamp, item['id']) for item in cart_items.values()]
+    engine = _get_memory_carts()
     
-    conn.commit()
+    # One write transaction for the whole checkout. BEGIN IMMEDIATE takes the write
+    # lock up front, so a competing writer is detected (and retried) before any
+    # row is touched rather than half way through the basket. Only the
+    # transaction is retried; the cache updates below run once, after the commit.
+    with _cart_write([trolley_id]):
+        for attempt in range(config.DB_WRITE_RETRIES + 1):
+            try:
+                with connection() as conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    
+                    # Insert Sale (line items live in sale_items, the legacy blob column stays empty)
+                    cur = conn.execute('INSERT INTO sales (timestamp, ts_epoch, total, items, trolley_id) VALUES (?, ?, ?, ?, ?)', 
+                                       (timestamp, now.timestamp(), final_total, '[]', trolley_id))
+                    conn.executemany(SALE_ITEM_INSERT, _sale_item_rows(cur.lastrowid, cart_items.values()))
+                    _add_to_rollups(conn, now, final_total, cart_items.values())
+                    
+                    # Update Stock and Last Updated
+                    conn.executemany('UPDATE products SET stock = MAX(0, stock - ?), last_updated = ? WHERE id = ?', 
+                                     stock_updates)
+                    
+                    # Clear this trolley's cart (any written-behind rows included)
+                    conn.execute('DELETE FROM cart WHERE trolley_id = ?', (trolley_id,))
+                    
+                    conn.commit()
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == config.DB_WRITE_RETRIES:
+                    raise
+                time.sleep(config.DB_WRITE_RETRY_DELAY * (2 ** attempt))
+        
+        if engine is not None:
+            engine.clear(trolley_id)
+        try:
+            with connection() as conn:
+                _catalog_put(conn, list(cart_items.keys()))
+        except sqlite3.Error:
+            invalidate_catalog()  # the sale is committed; re-read the catalog on next use
+        _cart_written(emptied=[trolley_id])
+    _bump_sales_version()
     
     # Return formatted order object
     return {
@@ -236,10 +793,23 @@ def record_sale(cart_items, total_amount, discount_percent=0):
         "discount_applied": discount_percent
     }
 
-def get_sales_history():
-    conn = get_db_connection()
-    sales = conn.execute('SELECT * FROM sales').fetchall()
-    conn.close()
+def _sale_item_dict(row):
+    return {
+        "id": row['product_id'],
+        "name": row['name'],
+        "category": row['category'],
+        "qty": row['qty'],
+        "price": row['unit_price'],
+        "final_price": row['final_price']
+    }
+
+def _sales_with_items(conn):
+    sales = conn.execute('SELECT id, timestamp, total FROM sales ORDER BY id').fetchall()
+    lines = conn.execute('SELECT * FROM sale_items ORDER BY sale_id, id').fetchall()
+    
+    items_by_sale = {}
+    for line in lines:
+        items_by_sale.setdefault(line['sale_id'], []).append(_sale_item_dict(line))
     
     history = []
     for s in sales:
@@ -247,23 +817,323 @@ def get_sales_history():
             "id": s['id'],
             "timestamp": s['timestamp'],
             "total": s['total'],
-            "items": json.loads(s['items'])
+            "items": items_by_sale.get(s['id'], [])
         })
     return history
 
+def get_sales_history():
+    with connection() as conn:
+        return _sales_with_items(conn)
+
+def _sales_filter(after_id=None, before_id=None, start=None, end=None):
+    clauses, params = [], []
+    if after_id is not None:
+        clauses.append('s.id > ?')
+        params.append(after_id)
+    if before_id is not None:
+        clauses.append('s.id < ?')
+        params.append(before_id)
+    if start is not None:
+        clauses.append('s.ts_epoch >= ?')
+        params.append(_to_epoch(start))
+    if end is not None:
+        clauses.append('s.ts_epoch < ?')
+        params.append(_to_epoch(end))
+    return ('WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+def get_sales_page(after_id=None, before_id=None, limit=50, start=None, end=None, newest_first=False):
+    """
+    Keyset pagination over sales. Oldest-first pages continue with after_id,
+    newest-first pages with before_id. start/end bound the timestamp.
+    Returns (sales, next_cursor) where next_cursor is None on the last page.
+    """
+    where, params = _sales_filter(after_id, before_id, start, end)
+    order = 'DESC' if newest_first else 'ASC'
+    with connection() as conn:
+        rows = conn.execute(f'''
+            SELECT s.id, s.timestamp, s.total FROM sales s {where}
+            ORDER BY s.id {order} LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            return [], None
+
+        ids = [r['id'] for r in rows]
+        lines = conn.execute('''
+            SELECT * FROM sale_items WHERE sale_id BETWEEN ? AND ? ORDER BY sale_id, id
+        ''', (min(ids), max(ids))).fetchall()
+
+    items_by_sale = {}
+    for line in lines:
+        items_by_sale.setdefault(line['sale_id'], []).append(_sale_item_dict(line))
+    sales = [{"id": r['id'], "timestamp": r['timestamp'], "total": r['total'], "items": items_by_sale.get(r['id'], [])}
+             for r in rows]
+    return sales, (ids[-1] if has_more else None)
+
+def iter_sales(after_id=None, start=None, end=None, batch_size=500):
+    """
+    Yield sales (with their items) oldest first, reading from a cursor rather
+    than building a list, so memory stays flat for any history size. Holds its
+    own pooled connection for as long as the generator is alive.
+    """
+    where, params = _sales_filter(after_id, None, start, end)
+    conn = acquire_connection()
+    cur = None
+    try:
+        cur = conn.execute(f'''
+            SELECT s.id AS sale_id, s.timestamp, s.total, si.product_id, si.name, si.category,
+                   si.qty, si.unit_price, si.final_price
+            FROM sales s LEFT JOIN sale_items si ON si.sale_id = s.id
+            {where}
+            ORDER BY s.id, si.id
+        ''', params)
+        sale = None
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if sale is None or sale['id'] != row['sale_id']:
+                    if sale is not None:
+                        yield sale
+                    sale = {"id": row['sale_id'], "timestamp": row['timestamp'], "total": row['total'], "items": []}
+                if row['product_id'] is not None or row['name'] is not None:
+                    sale['items'].append(_sale_item_dict(row))
+        if sale is not None:
+            yield sale
+    finally:
+        if cur is not None:
+            cur.close()
+        release_connection(conn)
+
+def get_sale_columns(after_id=0):
+    """
+    Sales with id > after_id as plain rows for columnar loaders, oldest first:
+    ([(id, ts_epoch, total)], [(sale_id, category, product_id, name, qty, final_price)]).
+    Lines are bounded by the last sale returned, so a checkout committing in
+    between is picked up whole on the next call.
+    """
+    with connection() as conn:
+        sales = conn.execute('SELECT id, ts_epoch, total FROM sales WHERE id > ? AND ts_epoch IS NOT NULL ORDER BY id',
+                             (after_id,)).fetchall()
+        if not sales:
+            return [], []
+        lines = conn.execute('''
+            SELECT sale_id, category, product_id, name, qty, final_price FROM sale_items
+            WHERE sale_id > ? AND sale_id <= ? ORDER BY sale_id, id
+        ''', (after_id, sales[-1][0])).fetchall()
+    return [tuple(r) for r in sales], [tuple(r) for r in lines]
+
+def get_recent_sales(limit=5):
+    """Newest sales first, with the number of lines in each basket."""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT s.id, s.timestamp, s.total,
+                   (SELECT COUNT(*) FROM sale_items si WHERE si.sale_id = s.id) AS items_count
+            FROM sales s
+            ORDER BY s.id DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+# SQL expressions mapping ts_epoch to a local-time bucket key
+SALES_BUCKETS = {
+    'hour': "strftime('%Y-%m-%d %H', ts_epoch, 'unixepoch', 'localtime')",
+    'day': "date(ts_epoch, 'unixepoch', 'localtime')",
+    'month': "strftime('%Y-%m', ts_epoch, 'unixepoch', 'localtime')",
+}
+
+def get_sales_summary(start=None, end=None):
+    """
+    Order count and revenue for sales in [start, end), or all time.
+    """
+    with connection() as conn:
+        if start is not None and end is not None:
+            row = conn.execute('SELECT COUNT(*) AS orders, COALESCE(SUM(total), 0) AS revenue FROM sales WHERE ts_epoch >= ? AND ts_epoch < ?',
+                               (_to_epoch(start), _to_epoch(end))).fetchone()
+        else:
+            row = conn.execute('SELECT COUNT(*) AS orders, COALESCE(SUM(total), 0) AS revenue FROM sales').fetchone()
+    return {"orders": row['orders'], "revenue": row['revenue']}
+
+# --- Sales Rollups ---
+ROLLUP_PERIODS = {
+    'hour': ('%Y-%m-%d %H', SALES_BUCKETS['hour']),
+    'day': ('%Y-%m-%d', SALES_BUCKETS['day']),
+    'month': ('%Y-%m', SALES_BUCKETS['month']),
+}
+CATEGORY_ROLLUP_PERIODS = ('day', 'month')
+
+def _add_to_rollups(conn, when, total, items):
+    """Fold one sale into the rollup tables; runs inside record_sale's transaction."""
+    items = list(items)
+    item_count = sum(item.get('qty', 1) for item in items)
+    conn.executemany('''
+        INSERT INTO sales_rollup (period, bucket, revenue, orders, items) VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT (period, bucket) DO UPDATE SET
+            revenue = revenue + excluded.revenue,
+            orders = orders + 1,
+            items = items + excluded.items
+    ''', [(period, when.strftime(fmt), total, item_count) for period, (fmt, _) in ROLLUP_PERIODS.items()])
+
+    by_category = {}
+    for item in items:
+        cat = item.get('category') or ''
+        revenue, qty = by_category.get(cat, (0, 0))
+        price = item.get('final_price', item.get('price', 0))
+        by_category[cat] = (revenue + price * item.get('qty', 1), qty + item.get('qty', 1))
+    conn.executemany('''
+        INSERT INTO sales_rollup_category (period, bucket, category, revenue, items) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (period, bucket, category) DO UPDATE SET
+            revenue = revenue + excluded.revenue,
+            items = items + excluded.items
+    ''', [(period, when.strftime(ROLLUP_PERIODS[period][0]), cat, revenue, qty)
+          for period in CATEGORY_ROLLUP_PERIODS
+          for cat, (revenue, qty) in by_category.items()])
+
+    by_product = {}
+    for item in items:
+        key = item.get('id') if item.get('id') is not None else (item.get('name') or '')
+        qty = item.get('qty', 1)
+        _, _, quantity, revenue = by_product.get(key, (None, None, 0, 0))
+        price = item.get('final_price', item.get('price', 0))
+        by_product[key] = (item.get('id'), item.get('name'), quantity + qty, revenue + price * qty)
+    conn.executemany('''
+        INSERT INTO sales_rollup_product (product_key, product_id, name, quantity, revenue) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (product_key) DO UPDATE SET
+            name = excluded.name,
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue
+    ''', [(key,) + row for key, row in by_product.items()])
+
+def _rebuild_rollups(c):
+    c.execute('DELETE FROM sales_rollup')
+    c.execute('DELETE FROM sales_rollup_category')
+    for period, (_, key_expr) in ROLLUP_PERIODS.items():
+        c.execute(f'''
+            INSERT INTO sales_rollup (period, bucket, revenue, orders, items)
+            SELECT ?, {key_expr} AS bucket, SUM(total), COUNT(*),
+                   COALESCE(SUM((SELECT SUM(qty) FROM sale_items si WHERE si.sale_id = sales.id)), 0)
+            FROM sales
+            WHERE ts_epoch IS NOT NULL
+            GROUP BY bucket
+        ''', (period,))
+    for period in CATEGORY_ROLLUP_PERIODS:
+        key_expr = ROLLUP_PERIODS[period][1]
+        c.execute(f'''
+            INSERT INTO sales_rollup_category (period, bucket, category, revenue, items)
+            SELECT ?, {key_expr} AS bucket, COALESCE(si.category, '') AS cat,
+                   SUM(si.final_price * si.qty), SUM(si.qty)
+            FROM sale_items si JOIN sales ON sales.id = si.sale_id
+            WHERE ts_epoch IS NOT NULL
+            GROUP BY bucket, cat
+        ''', (period,))
+
+def _rebuild_product_rollup(c):
+    c.execute('DELETE FROM sales_rollup_product')
+    # The bare product_id / name come from the row holding MAX(id), i.e. the newest line
+    c.execute('''
+        INSERT INTO sales_rollup_product (product_key, product_id, name, quantity, revenue)
+        SELECT product_key, product_id, name, quantity, revenue FROM (
+            SELECT COALESCE(product_id, name, '') AS product_key, product_id, name, MAX(id),
+                   SUM(qty) AS quantity, SUM(final_price * qty) AS revenue
+            FROM sale_items
+            GROUP BY product_key
+        )
+    ''')
+
+def rebuild_rollups():
+    """Recompute every rollup row from sales/sale_items (for imported or repaired history)."""
+    with connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        _rebuild_rollups(conn)
+        _rebuild_product_rollup(conn)
+        conn.commit()
+    _bump_sales_version()
+
+def get_rollup(period, first_bucket, last_bucket):
+    """
+    Rollup rows with first_bucket <= bucket <= last_bucket, as
+    {bucket: {"amount", "orders", "items"}}. Bucket keys sort chronologically.
+    """
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT bucket, revenue, orders, items FROM sales_rollup
+            WHERE period = ? AND bucket BETWEEN ? AND ?
+        ''', (period, first_bucket, last_bucket)).fetchall()
+    return {r['bucket']: {"amount": r['revenue'], "orders": r['orders'], "items": r['items']} for r in rows}
+
+def get_category_totals():
+    """All-time revenue per category from the monthly rollups; '' collects lines sold without one."""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT category, SUM(revenue) AS amount
+            FROM sales_rollup_category
+            WHERE period = 'month'
+            GROUP BY category
+        ''').fetchall()
+    return {r['category']: r['amount'] for r in rows}
+
+def get_top_products(limit=20, start=None, end=None):
+    """
+    Best sellers by revenue between start and end (optional, see _sales_filter),
+    one row per product id. Lines without a product id (legacy imports) are
+    grouped by name. Each row is labelled with the product's current catalog
+    name, falling back to the name on its newest sale line, so a rename does
+    not split a product in two. All-time figures come from sales_rollup_product.
+    """
+    where, params = _sales_filter(start=start, end=end)
+    with connection() as conn:
+        if where:
+            # The ts_epoch index picks the sales; the bare si.product_id / si.name
+            # come from the row holding MAX(si.id)
+            rows = conn.execute(f'''
+                SELECT si.product_id AS id, si.name AS name, MAX(si.id) AS last_line,
+                       SUM(si.qty) AS quantity, SUM(si.final_price * si.qty) AS revenue
+                FROM sale_items si JOIN sales s ON s.id = si.sale_id
+                {where}
+                GROUP BY COALESCE(si.product_id, si.name)
+                ORDER BY revenue DESC
+                LIMIT ?
+            ''', params + [limit]).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT product_id AS id, name, quantity, revenue FROM sales_rollup_product
+                ORDER BY revenue DESC
+                LIMIT ?
+            ''', (limit,)).fetchall()
+    top = []
+    for r in rows:
+        product = get_product(r['id']) if r['id'] else None
+        top.append({"id": r['id'], "name": (product or {}).get('name') or r['name'] or 'Unknown',
+                    "quantity": r['quantity'], "revenue": round(r['revenue'], 2)})
+    return top
+
 # --- Worker Helpers ---
+# Values for optional fields when a product is first created
+PRODUCT_DEFAULTS = {
+    "unit": "",
+    "stock": 0,
+    "discount": 0,
+    "promotion_description": "",
+    "promotion_expiry": "",
+    "category": "General",
+    "image": "/customer-frontend/static/images/default.png"
+}
+PRODUCT_COLUMNS = ('name', 'unit', 'price', 'stock', 'category', 'image', 'discount', 'promotion_description', 'promotion_expiry')
+
 def add_product(product):
-    conn = get_db_connection()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    try:
-        conn.execute('INSERT INTO products (id, name, unit, price, stock, category, image, last_updated, discount, promotion_description, promotion_expiry) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                     (product['id'], product['name'], product['unit'], product['price'], product['stock'], product['category'], product['image'], timestamp, product.get('discount', 0), product.get('promotion_description', ''), product.get('promotion_expiry', '')))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with connection() as conn:
+        try:
+            conn.execute('INSERT INTO products (id, name, unit, price, stock, category, image, last_updated, discount, promotion_description, promotion_expiry) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (product['id'], product['name'], product['unit'], product['price'], product['stock'], product['category'], product['image'], timestamp, product.get('discount', 0), product.get('promotion_description', ''), product.get('promotion_expiry', '')))
+            conn.commit()
+            _catalog_put(conn, [product['id']])
+            return True
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return False
 
 def update_product_fields(pid, updates):
     """
@@ -273,125 +1143,182 @@ def update_product_fields(pid, updates):
     if not updates:
         return
         
-    conn = get_db_connection()
     updates['last_updated'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     set_clause = ', '.join([f"{k} = ?" for k in updates.keys()])
     values = list(updates.values()) + [pid]
     
-    conn.execute(f'UPDATE products SET {set_clause} WHERE id = ?', values)
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute(f'UPDATE products SET {set_clause} WHERE id = ?', values)
+        conn.commit()
+        _catalog_put(conn, [pid])
+
+def upsert_products(products):
+    """
+    Insert or update many products in a single transaction (bulk import).
+    Each dict needs 'id', 'name' and 'price'. New products get PRODUCT_DEFAULTS
+    for anything missing; existing products only have the supplied fields
+    overwritten. Rows are grouped by their set of fields so each group is one
+    executemany. The catalog cache is refreshed once at the end.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    groups = {}
+    for p in products:
+        supplied = tuple(c for c in PRODUCT_COLUMNS if c in p)
+        groups.setdefault(supplied, []).append(p)
+
+    insert_cols = ('id',) + PRODUCT_COLUMNS + ('last_updated',)
+    placeholders = ', '.join('?' * len(insert_cols))
+    with connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for supplied, rows in groups.items():
+            set_clause = ', '.join(f'{c} = excluded.{c}' for c in supplied + ('last_updated',))
+            conn.executemany(
+                f'''INSERT INTO products ({', '.join(insert_cols)}) VALUES ({placeholders})
+                    ON CONFLICT (id) DO UPDATE SET {set_clause}''',
+                [tuple([p['id']] + [p.get(c, PRODUCT_DEFAULTS.get(c)) for c in PRODUCT_COLUMNS] + [timestamp]) for p in rows]
+            )
+        conn.commit()
+    invalidate_catalog()
+    return len(products)
 
 def delete_product(pid):
-    conn = get_db_connection()
-    try:
-        # Delete from cart first (foreign key constraint usually handles this but being safe)
-        conn.execute('DELETE FROM cart WHERE product_id = ?', (pid,))
-        conn.execute('DELETE FROM products WHERE id = ?', (pid,))
+    with connection() as conn:
+        try:
+            # Delete from cart first (foreign key constraint usually handles this but being safe)
+            conn.execute('DELETE FROM cart WHERE product_id = ?', (pid,))
+            conn.execute('DELETE FROM products WHERE id = ?', (pid,))
+            conn.commit()
+            engine = _get_memory_carts()
+            if engine is not None:
+                engine.drop_product(pid)
+            _catalog_remove(pid)
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error deleting product: {e}")
+            return False
+
+# --- Frozen Products ---
+# Products blocked by an admin emergency freeze. Checked on every scan, so the
+# table is mirrored into an in-memory set that freeze/unfreeze replace after
+# their commit (never mutated in place, like the catalog cache).
+_frozen = None  # set of product ids, loaded on first use
+_frozen_lock = threading.Lock()
+
+def _get_frozen():
+    global _frozen
+    if _frozen is None:
+        with _frozen_lock:
+            if _frozen is None:
+                with connection() as conn:
+                    _frozen = {row[0] for row in conn.execute('SELECT product_id FROM frozen_products')}
+    return _frozen
+
+def is_frozen(pid):
+    return pid in _get_frozen()
+
+def freeze_product(pid):
+    global _frozen
+    with connection() as conn:
+        conn.execute('INSERT OR IGNORE INTO frozen_products (product_id, frozen_at) VALUES (?, ?)',
+                     (pid, datetime.now().isoformat()))
         conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error deleting product: {e}")
-        return False
-    finally:
-        conn.close()
+    with _frozen_lock:
+        if _frozen is not None:
+            _frozen = _frozen | {pid}
+
+def unfreeze_product(pid):
+    global _frozen
+    with connection() as conn:
+        conn.execute('DELETE FROM frozen_products WHERE product_id = ?', (pid,))
+        conn.commit()
+    with _frozen_lock:
+        if _frozen is not None:
+            _frozen = _frozen - {pid}
 
 # --- UI Settings Helpers ---
 def get_ui_settings():
-    conn = get_db_connection()
-    try:
-        settings_rows = conn.execute('SELECT key, value FROM ui_settings').fetchall()
-        settings = {row['key']: row['value'] for row in settings_rows}
-        return settings
-    except Exception as e:
-        print(f"Error getting settings: {e}")
-        return {}
-    finally:
-        conn.close()
+    with connection() as conn:
+        try:
+            settings_rows = conn.execute('SELECT key, value FROM ui_settings').fetchall()
+            settings = {row['key']: row['value'] for row in settings_rows}
+            return settings
+        except Exception as e:
+            print(f"Error getting settings: {e}")
+            return {}
 
 def update_ui_settings(settings_dict):
-    conn = get_db_connection()
-    try:
-        for k, v in settings_dict.items():
-            # Check if key exists
-            cursor = conn.execute('SELECT 1 FROM ui_settings WHERE key = ?', (k,))
-            if cursor.fetchone():
-                conn.execute('UPDATE ui_settings SET value = ? WHERE key = ?', (v, k))
-            else:
-                conn.execute('INSERT INTO ui_settings (key, value) VALUES (?, ?)', (k, v))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error updating settings: {e}")
-        return False
-    finally:
-        conn.close()
+    with connection() as conn:
+        try:
+            for k, v in settings_dict.items():
+                # Check if key exists
+                cursor = conn.execute('SELECT 1 FROM ui_settings WHERE key = ?', (k,))
+                if cursor.fetchone():
+                    conn.execute('UPDATE ui_settings SET value = ? WHERE key = ?', (v, k))
+                else:
+                    conn.execute('INSERT INTO ui_settings (key, value) VALUES (?, ?)', (k, v))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error updating settings: {e}")
+            return False
 
 # --- promotions ---
-import time
-
 def add_promotion(type, title, content_data):
-    conn = get_db_connection()
-    try:
-        content_json = json.dumps(content_data)
-        created_at = datetime.now().isoformat()
-        conn.execute('INSERT INTO promotions (type, title, content, active, created_at) VALUES (?, ?, ?, ?, ?)',
-                     (type, title, content_json, 1, created_at))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"db.error: {e}")
-        return False
-    finally:
-        conn.close()
+    with connection() as conn:
+        try:
+            content_json = json.dumps(content_data)
+            created_at = datetime.now().isoformat()
+            conn.execute('INSERT INTO promotions (type, title, content, active, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (type, title, content_json, 1, created_at))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"db.error: {e}")
+            return False
 
 def list_promotions():
-    conn = get_db_connection()
-    try:
+    with connection() as conn:
         rows = conn.execute('SELECT * FROM promotions ORDER BY id DESC').fetchall()
-        promos = []
-        for r in rows:
-            # Handle optional columns that may not exist in older databases
-            try:
-                created_at = r['created_at']
-            except (KeyError, IndexError):
-                created_at = None
+    promos = []
+    for r in rows:
+        # Handle optional columns that may not exist in older databases
+        try:
+            created_at = r['created_at']
+        except (KeyError, IndexError):
+            created_at = None
+        
+        try:
+            last_shown = r['last_shown']
+        except (KeyError, IndexError):
+            last_shown = None
             
-            try:
-                last_shown = r['last_shown']
-            except (KeyError, IndexError):
-                last_shown = None
-                
-            promos.append({
-                "id": r['id'],
-                "type": r['type'],
-                "title": r['title'],
-                "content": json.loads(r['content']),
-                "active": bool(r['active']),
-                "created_at": created_at,
-                "last_shown": last_shown
-            })
-        return promos
-    finally:
-        conn.close()
+        promos.append({
+            "id": r['id'],
+            "type": r['type'],
+            "title": r['title'],
+            "content": json.loads(r['content']),
+            "active": bool(r['active']),
+            "created_at": created_at,
+            "last_shown": last_shown
+        })
+    return promos
 
 def delete_promotion(id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM promotions WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute('DELETE FROM promotions WHERE id = ?', (id,))
+        conn.commit()
     return True
 
 def update_promotion_last_shown(id):
     """Update the last_shown timestamp for a promotion"""
-    conn = get_db_connection()
-    try:
-        now = datetime.now().isoformat()
+    now = datetime.now().isoformat()
+    with connection() as conn:
         conn.execute('UPDATE promotions SET last_shown = ? WHERE id = ?', (now, id))
         conn.commit()
-    finally:
-        conn.close()
 
 def get_current_promotion():
     """
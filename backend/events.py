@@ -0,0 +1,57 @@
+import json
+import queue
+import threading
+
+# In-process publish/subscribe used to push cart and promotion changes to kiosk
+# Server-Sent Event streams. Topics are trolley IDs plus PROMOTIONS_TOPIC. Each
+# subscriber gets a small bounded queue; events are full snapshots, so when a
+# slow client falls behind its oldest pending event is dropped.
+
+PROMOTIONS_TOPIC = "__promotions__"
+
+class EventBus:
+    """Fan-out of (event, data) pairs to every subscriber of a topic."""
+
+    def __init__(self, max_pending=20):
+        self.max_pending = max_pending
+        self._subscribers = {}  # topic -> set of queues
+        self._lock = threading.Lock()
+
+    def subscribe(self, *topics):
+        sub = queue.Queue(maxsize=self.max_pending)
+        sub.topics = topics
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for topic in sub.topics:
+                subs = self._subscribers.get(topic)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[topic]
+
+    def publish(self, topic, event, data):
+        with self._lock:
+            subs = list(self._subscribers.get(topic, ()))
+        for sub in subs:
+            while True:
+                try:
+                    sub.put_nowait((event, data))
+                    break
+                except queue.Full:
+                    try:
+                        sub.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({sub for subs in self._subscribers.values() for sub in subs})
+
+def sse(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
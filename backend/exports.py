@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+import zlib
+
+# Streaming serializers for sales exports. Each takes an iterable of sale dicts
+# (as yielded by db.iter_sales) and yields text chunks, so an export of any size
+# is produced row by row without building the file in memory.
+
+CHUNK_SIZE = 64 * 1024
+
+SALE_LINE_COLUMNS = ['sale_id', 'timestamp', 'sale_total', 'product_id', 'name', 'category',
+                     'qty', 'unit_price', 'final_price', 'line_total']
+
+def sales_csv(sales):
+    """One CSV row per sale line; sales without lines get a single row with empty item columns."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(SALE_LINE_COLUMNS)
+    for sale in sales:
+        for item in sale['items'] or [None]:
+            if item is None:
+                writer.writerow([sale['id'], sale['timestamp'], sale['total']] + [''] * 7)
+                continue
+            writer.writerow([
+                sale['id'], sale['timestamp'], sale['total'],
+                item['id'], item['name'], item['category'] or '',
+                item['qty'], item['price'], item['final_price'],
+                round(item['final_price'] * item['qty'], 2)
+            ])
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def sales_ndjson(sales):
+    """One JSON object per sale (with its items) per line."""
+    chunk = []
+    size = 0
+    for sale in sales:
+        line = json.dumps(sale) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    yield ''.join(chunk)
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of text chunks into a .gz byte stream on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,10 @@
+import db
+
+# Recompute the hourly/daily/monthly and per-product sales rollups from the full sales history.
+# Run after restoring a backup or importing sales outside of checkout:
+#   python rebuild_rollups.py
+if __name__ == "__main__":
+    db.init_db()
+    print("Rebuilding sales rollups...")
+    db.rebuild_rollups()
+    print("Done.")
@@ -0,0 +1,114 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+# MFRC522 readers keep re-reporting a tag while it lingers in the field. This
+# filter drops repeat reads of the same tag on the same trolley until the tag
+# has been out of sight for `window` seconds, so a burst costs a dict lookup
+# instead of a cart write.
+#
+# Sightings are not always in time order (/rfid/batch back-dates scans from
+# device timestamps), so a read is a repeat only if it falls inside the window
+# of the last sighting, and expiry goes through a min-heap of sighting times
+# rather than insertion order. Heap entries superseded by a later sighting are
+# skipped when they come due.
+
+class ScanDeduplicator:
+    """Map of (trolley_id, uid) -> last sighting, expired through a heap of sighting times."""
+
+    def __init__(self, window):
+        self.window = window
+        self._seen = {}
+        self._heap = []  # (seen_at, trolley_id, uid)
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.suppressed = 0
+        self.suppressed_by_trolley = {}
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        heap = self._heap
+        while heap and heap[0][0] <= cutoff:
+            seen_at, trolley_id, uid = heapq.heappop(heap)
+            key = (trolley_id, uid)
+            if self._seen.get(key) == seen_at:
+                del self._seen[key]
+
+    def accept(self, trolley_id, uid, now=None):
+        """True if this read should be applied, False if it repeats a read still inside the window."""
+        if self.window <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        key = (trolley_id, uid)
+        with self._lock:
+            self._expire(now)
+            last = self._seen.get(key)
+            duplicate = last is not None and abs(now - last) < self.window
+            # Every sighting restarts the window, unless a later one already has
+            if last is None or now > last:
+                self._seen[key] = now
+                heapq.heappush(self._heap, (now, trolley_id, uid))
+            if duplicate:
+                self.suppressed += 1
+                self.suppressed_by_trolley[trolley_id] = self.suppressed_by_trolley.get(trolley_id, 0) + 1
+                return False
+            self.accepted += 1
+            return True
+
+    def forget(self, trolley_id):
+        """Drop a trolley's entries, e.g. after checkout so the next shopper starts clean."""
+        with self._lock:
+            for key in [k for k in self._seen if k[0] == trolley_id]:
+                del self._seen[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_seconds": self.window,
+                "accepted": self.accepted,
+                "suppressed": self.suppressed,
+                "suppressed_by_trolley": dict(self.suppressed_by_trolley),
+                "tracked": len(self._seen)
+            }
+
+
+# The reader re-sends a batch until it gets a 2xx reply, so a batch that was
+# applied but whose reply was lost arrives again under the same batch_id. The
+# last few applied IDs per trolley are kept to answer such re-sends without
+# adding their scans a second time.
+
+class BatchLog:
+    """Recently applied batch IDs per trolley, plus the batches being applied right now."""
+
+    def __init__(self, keep=16):
+        self.keep = keep
+        self._applied = {}  # trolley_id -> deque of batch IDs
+        self._pending = set()  # (trolley_id, batch_id)
+        self._lock = threading.Lock()
+        self.resent = 0
+
+    def claim(self, trolley_id, batch_id):
+        """
+        "new" if the caller should apply the batch (and then call finish),
+        "applied" if it already was, "pending" if another request is applying it.
+        """
+        with self._lock:
+            if batch_id in self._applied.get(trolley_id, ()):
+                self.resent += 1
+                return "applied"
+            if (trolley_id, batch_id) in self._pending:
+                return "pending"
+            self._pending.add((trolley_id, batch_id))
+            return "new"
+
+    def finish(self, trolley_id, batch_id, applied):
+        """Release a claim; only an applied batch is remembered, a failed one may be re-sent."""
+        with self._lock:
+            self._pending.discard((trolley_id, batch_id))
+            if applied:
+                self._applied.setdefault(trolley_id, deque(maxlen=self.keep)).append(batch_id)
+
+    def stats(self):
+        with self._lock:
+            return {"resent": self.resent, "pending": len(self._pending)}
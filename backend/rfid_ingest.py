@@ -0,0 +1,117 @@
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+
+import db
+
+# Asynchronous RFID ingest (config.RFID_INGEST_MODE = "async"). /rfid validates
+# a scan against in-memory state, enqueues it and answers straight away; one
+# writer thread drains the queue and applies every scan waiting at that moment
+# in a single cart transaction. Kiosks pick the change up on their next /cart
+# refresh.
+
+_STOP = object()
+
+class IngestQueue:
+    """In-process scan queue with a single coalescing writer thread."""
+
+    def __init__(self, on_applied=None, max_batch=500):
+        self.on_applied = on_applied  # called with the set of trolley IDs after each commit
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.applied = 0
+        self.batches = 0
+        self.failed = 0
+        self.largest_batch = 0
+        self._latencies = deque(maxlen=1000)  # seconds from enqueue to commit, recent scans
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rfid-ingest", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        """Apply whatever is still queued, then stop the writer."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def submit(self, trolley_id, pid):
+        self.start()
+        with self._stats_lock:
+            self.enqueued += 1
+        self._queue.put((trolley_id, pid, time.monotonic()))
+
+    def flush(self, timeout=2.0):
+        """Wait (bounded) until every scan submitted so far has been applied."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._stats_lock:
+                if self.applied + self.failed >= self.enqueued:
+                    return True
+            time.sleep(0.005)
+        return False
+
+    def _run(self):
+        while True:
+            scans = [self._queue.get()]
+            # Coalesce everything that queued up while the last batch was written
+            while len(scans) < self.max_batch:
+                try:
+                    scans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = _STOP in scans
+            scans = [s for s in scans if s is not _STOP]
+            if scans:
+                self._apply(scans)
+            if stopping:
+                return
+
+    def _apply(self, scans):
+        try:
+            db.add_scans_to_cart([(trolley_id, pid) for trolley_id, pid, _ in scans])
+        except Exception as e:
+            print(f"RFID ingest error ({len(scans)} scans dropped): {e}")
+            with self._stats_lock:
+                self.failed += len(scans)
+            return
+
+        done = time.monotonic()
+        with self._stats_lock:
+            self.applied += len(scans)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(scans))
+            self._latencies.extend(done - queued_at for _, _, queued_at in scans)
+
+        if self.on_applied:
+            try:
+                self.on_applied({trolley_id for trolley_id, _, _ in scans})
+            except Exception as e:
+                print(f"RFID ingest callback error: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "applied": self.applied,
+                "failed": self.failed,
+                "batches": self.batches,
+                "avg_batch": round(self.applied / self.batches, 2) if self.batches else 0,
+                "largest_batch": self.largest_batch,
+                "apply_latency_ms": {
+                    "p50": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+                    "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None,
+                    "max": round(latencies[-1] * 1000, 2) if latencies else None
+                }
+            }
@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import threading
+import time
+
+# In-memory registry of trolley heartbeats. Each session moves
+# Online -> Idle -> Abandoned -> evicted as time passes without a heartbeat.
+# Instead of scanning every session on each admin request, the next transition
+# of each session sits in a min-heap keyed by its due time; advance() pops only
+# the entries that are due. Heartbeats on an Online session do not touch the
+# heap: when its entry comes due it is simply rescheduled from the newer beat.
+
+ONLINE = "Online"
+IDLE = "Idle"
+ABANDONED = "Abandoned"
+
+class TrolleySession:
+    __slots__ = ('trolley_id', 'last_beat', 'item_count', 'total', 'customer', 'cart', 'etag', 'status', 'gen')
+
+    def __init__(self, trolley_id):
+        self.trolley_id = trolley_id
+        self.last_beat = 0.0  # time.monotonic()
+        self.item_count = 0
+        self.total = 0
+        self.customer = 'Guest' # Placeholder for future expansion
+        self.cart = {}
+        self.etag = None
+        self.status = ONLINE
+        self.gen = 0  # heap entries carrying an older gen are stale
+
+    def idle_seconds(self, now=None):
+        return (time.monotonic() if now is None else now) - self.last_beat
+
+class SessionRegistry:
+    def __init__(self, idle_after=60, abandoned_after=300, evict_after=3600):
+        self.idle_after = idle_after
+        self.abandoned_after = abandoned_after
+        self.evict_after = evict_after
+        self._sessions = {}
+        self._by_status = {ONLINE: set(), IDLE: set(), ABANDONED: set()}
+        self._heap = []  # (due, trolley_id, gen)
+        self._gen = itertools.count(1)
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def _schedule(self, session, due):
+        session.gen = next(self._gen)
+        heapq.heappush(self._heap, (due, session.trolley_id, session.gen))
+
+    def _set_status(self, session, status):
+        self._by_status[session.status].discard(session.trolley_id)
+        session.status = status
+        self._by_status[status].add(session.trolley_id)
+
+    def beat(self, trolley_id, item_count, total, cart, etag=None):
+        """Record a heartbeat with the cart it was computed from."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(trolley_id)
+            if session is None:
+                session = self._sessions[trolley_id] = TrolleySession(trolley_id)
+                self._by_status[ONLINE].add(trolley_id)
+                self._schedule(session, now + self.idle_after)
+            elif session.status != ONLINE:
+                self._set_status(session, ONLINE)
+                self._schedule(session, now + self.idle_after)
+            session.last_beat = now
+            session.item_count = item_count
+            session.total = total
+            session.cart = cart
+            session.etag = etag
+            self._advance(now)
+
+    def touch(self, trolley_id):
+        """Heartbeat without a new cart (e.g. an unchanged poll)."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(trolley_id)
+            if session is None:
+                return
+            session.last_beat = now
+            if session.status != ONLINE:
+                self._set_status(session, ONLINE)
+                self._schedule(session, now + self.idle_after)
+
+    def get(self, trolley_id):
+        return self._sessions.get(trolley_id)
+
+    def remove(self, trolley_id):
+        with self._lock:
+            session = self._sessions.pop(trolley_id, None)
+            if session is not None:
+                self._by_status[session.status].discard(trolley_id)
+
+    def _advance(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, trolley_id, gen = heapq.heappop(heap)
+            session = self._sessions.get(trolley_id)
+            if session is None or session.gen != gen:
+                continue
+            idle = now - session.last_beat
+            if idle < self.idle_after:
+                self._set_status(session, ONLINE)
+                self._schedule(session, session.last_beat + self.idle_after)
+            elif idle < self.abandoned_after:
+                self._set_status(session, IDLE)
+                self._schedule(session, session.last_beat + self.abandoned_after)
+            elif idle < self.evict_after:
+                self._set_status(session, ABANDONED)
+                self._schedule(session, session.last_beat + self.evict_after)
+            else:
+                del self._sessions[trolley_id]
+                self._by_status[session.status].discard(trolley_id)
+                self.evicted += 1
+
+    def advance(self):
+        """Apply every status change that has come due."""
+        with self._lock:
+            self._advance(time.monotonic())
+
+    def sessions(self):
+        self.advance()
+        with self._lock:
+            return sorted(self._sessions.values(), key=lambda s: s.trolley_id)
+
+    def with_status(self, status):
+        self.advance()
+        with self._lock:
+            return [self._sessions[t] for t in sorted(self._by_status[status])]
+
+    def stats(self):
+        self.advance()
+        with self._lock:
+            counts = {status: len(ids) for status, ids in self._by_status.items()}
+            return dict(counts, tracked=len(self._sessions), heap=len(self._heap), evicted=self.evicted)
@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+# Checks conditional GET on /cart: the ETag holds while nothing changes and
+# moves after a cart write or a price change. Runs the app in-process against
+# a throwaway database unless DB_FILE is set.
+#   python verify_cart_etag.py
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "verify_cart_etag.db"))
+os.environ.setdefault("DISABLE_AUDIT_LOG", "1")
+
+import db
+from app import app
+
+TROLLEY = "VERIFY-ETAG"
+MILK = "03563B38"
+
+def poll(client, etag=None, trolley_id=TROLLEY):
+    headers = {"If-None-Match": etag} if etag else {}
+    return client.get(f"/cart?trolley_id={trolley_id}", headers=headers)
+
+def test_unchanged_cart_is_304():
+    client = app.test_client()
+    db.clear_cart(TROLLEY)
+
+    print("Polling an unchanged cart with its ETag...")
+    etag = poll(client).headers.get("ETag")
+    res = poll(client, etag)
+    if etag and res.status_code == 304:
+        print("✅ Unchanged cart answered 304.")
+    else:
+        print(f"❌ Got {res.status_code} for ETag {etag}, expected 304.")
+
+    print("Changing another trolley's cart...")
+    client.post("/rfid", json={"uid": MILK, "trolley_id": "VERIFY-ETAG-OTHER"})
+    res = poll(client, etag)
+    if res.status_code == 304:
+        print("✅ Still 304, other carts do not touch this ETag.")
+    else:
+        print(f"❌ Got {res.status_code}, expected 304.")
+
+def test_cart_change_moves_etag():
+    client = app.test_client()
+    db.clear_cart(TROLLEY)
+    etag = poll(client).headers.get("ETag")
+
+    print("Scanning an item, then polling with the old ETag...")
+    client.post("/rfid", json={"uid": MILK, "trolley_id": TROLLEY})
+    res = poll(client, etag)
+    items = res.get_json().get("items", {}) if res.status_code == 200 else {}
+    if res.status_code == 200 and res.headers.get("ETag") != etag and MILK in items:
+        print("✅ Cart change returned the new cart with a new ETag.")
+    else:
+        print(f"❌ Got {res.status_code}, expected 200 with the scanned item.")
+
+    print("Removing it again...")
+    etag = res.headers.get("ETag")
+    client.post("/cart/remove", json={"uid": MILK, "trolley_id": TROLLEY})
+    res = poll(client, etag)
+    if res.status_code == 200 and res.get_json().get("items") == {}:
+        print("✅ Removal returned the empty cart.")
+    else:
+        print(f"❌ Got {res.status_code}, expected 200 with an empty cart.")
+
+def test_price_change_moves_etag():
+    client = app.test_client()
+    db.clear_cart(TROLLEY)
+    client.post("/rfid", json={"uid": MILK, "trolley_id": TROLLEY})
+    res = poll(client)
+    etag, total = res.headers.get("ETag"), res.get_json().get("total")
+
+    print("Changing the price of an item in the cart...")
+    with client.session_transaction() as sess:
+        sess['worker_logged_in'] = True
+    price = db.get_product(MILK)['price'] + 10
+    client.post("/api/worker/update-product", json={"id": MILK, "price": price})
+    res = poll(client, etag)
+    if res.status_code == 200 and res.get_json().get("total") == total + 10:
+        print("✅ Price change returned the repriced cart.")
+    else:
+        print(f"❌ Got {res.status_code}, expected 200 with total {total + 10}.")
+
+    print("Polling again with the new ETag...")
+    res = poll(client, res.headers.get("ETag"))
+    if res.status_code == 304:
+        print("✅ Repriced cart answered 304 once seen.")
+    else:
+        print(f"❌ Got {res.status_code}, expected 304.")
+
+if __name__ == "__main__":
+    db.init_db()
+    test_unchanged_cart_is_304()
+    test_cart_change_moves_etag()
+    test_price_change_moves_etag()
@@ -0,0 +1,124 @@
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+# Checks that in-memory carts (CART_ENGINE=memory) survive the process going
+# away: killed before a flush (journal replay), killed after one (write-behind),
+# and stopped by systemd (SIGTERM flush). Each case runs this script as a child
+# against its own throwaway database.
+#   python verify_cart_recovery.py
+
+TROLLEY = "VERIFY-RECOVERY"
+MILK, TEA = "03563B38", "435D1D39"
+EXPECTED = {MILK: 2, TEA: 1}
+
+def child(action):
+    import db
+    from app import handle_sigterm
+    db.init_db()
+    if action == "write":
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        db.add_many_to_cart(TROLLEY, [MILK, MILK, MILK, TEA])
+        db.remove_from_cart(TROLLEY, MILK)
+        print("ready", flush=True)
+        while True:
+            time.sleep(1)
+    elif action == "read":
+        items = db.get_cart_items(TROLLEY)
+        print(json.dumps({pid: item["qty"] for pid, item in items.items()}), flush=True)
+
+def start_child(action, env):
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", action], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+def write_cart(env):
+    proc = start_child("write", env)
+    for line in proc.stdout:
+        if line.strip() == "ready":
+            return proc
+    raise RuntimeError("writer exited before the cart was written")
+
+def read_cart(env):
+    proc = start_child("read", env)
+    out, _ = proc.communicate(timeout=60)
+    return json.loads(out.strip().splitlines()[-1])
+
+def saved_cart(env):
+    """Cart rows in SQLite, as the restarted service would find them before any replay."""
+    conn = sqlite3.connect(env["DB_FILE"])
+    try:
+        rows = conn.execute("SELECT product_id, qty FROM cart WHERE trolley_id = ?", (TROLLEY,)).fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+def make_env(flush_interval):
+    env = dict(os.environ)
+    env.update({
+        "DB_FILE": os.path.join(tempfile.mkdtemp(), "verify_cart_recovery.db"),
+        "CART_ENGINE": "memory",
+        "CART_FLUSH_INTERVAL": str(flush_interval),
+        "DISABLE_AUDIT_LOG": "1",
+    })
+    env.pop("CART_JOURNAL_FILE", None)
+    return env
+
+def test_journal_replay():
+    env = make_env(3600)
+    print("Writing a cart, then killing the process before any flush...")
+    proc = write_cart(env)
+    proc.kill()
+    proc.wait()
+    if saved_cart(env):
+        print("❌ Cart reached SQLite, nothing left for the journal to prove.")
+    recovered = read_cart(env)
+    if recovered == EXPECTED:
+        print("✅ Cart replayed from the journal after restart.")
+    else:
+        print(f"❌ Recovered {recovered}, expected {EXPECTED}.")
+
+def test_write_behind_flush():
+    env = make_env(0.2)
+    print("Writing a cart, waiting for the write-behind flush, then killing the process...")
+    proc = write_cart(env)
+    time.sleep(1.5)
+    proc.kill()
+    proc.wait()
+    saved = saved_cart(env)
+    if saved == EXPECTED:
+        print("✅ Cart written behind to SQLite.")
+    else:
+        print(f"❌ SQLite holds {saved}, expected {EXPECTED}.")
+    # Without the journal the restart can only rely on what was flushed
+    os.remove(env["DB_FILE"] + ".carts.jsonl")
+    recovered = read_cart(env)
+    if recovered == EXPECTED:
+        print("✅ Cart recovered from SQLite alone.")
+    else:
+        print(f"❌ Recovered {recovered}, expected {EXPECTED}.")
+
+def test_flush_on_stop():
+    env = make_env(3600)
+    print("Writing a cart, then stopping the process with SIGTERM...")
+    proc = write_cart(env)
+    proc.send_signal(signal.SIGTERM)
+    code = proc.wait(timeout=30)
+    saved = saved_cart(env)
+    if code == 0 and saved == EXPECTED:
+        print("✅ Pending changes flushed on stop.")
+    else:
+        print(f"❌ Exit code {code}, SQLite holds {saved}, expected {EXPECTED}.")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        child(sys.argv[2])
+    else:
+        test_journal_replay()
+        test_write_behind_flush()
+        test_flush_on_stop()
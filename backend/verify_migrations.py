@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import tempfile
+
+# Checks that a database in the original (pre-migration) format is brought up
+# to the current schema with its cart, frozen products and sales intact. The
+# old database is built here from the original CREATE statements.
+#   python verify_migrations.py
+
+os.environ["DB_FILE"] = os.path.join(tempfile.mkdtemp(), "verify_migrations.db")
+os.environ.setdefault("DISABLE_AUDIT_LOG", "1")
+
+import config
+import db
+
+MILK, TEA, SUGAR = "03563B38", "435D1D39", "83E69038"
+SALES = [
+    ("2025-01-05T10:15:00.123456", [{"id": MILK, "name": "Milk Packet", "price": 25, "final_price": 25, "qty": 2}]),
+    ("2025-02-11T18:40:00.654321", [{"id": TEA, "name": "Tea Powder", "price": 120, "final_price": 108, "qty": 1},
+                                    {"id": SUGAR, "name": "Sugar", "price": 45, "final_price": 45, "qty": 3}]),
+]
+
+def build_original_db(path):
+    """The schema and data the first release's init_db left behind (user_version 0)."""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE products (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            unit TEXT,
+            price REAL NOT NULL,
+            stock INTEGER DEFAULT 0,
+            category TEXT,
+            image TEXT,
+            last_updated TEXT,
+            discount REAL DEFAULT 0,
+            promotion_description TEXT,
+            promotion_expiry TEXT
+        );
+        CREATE TABLE cart (
+            product_id TEXT PRIMARY KEY,
+            qty INTEGER DEFAULT 1,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        );
+        CREATE TABLE sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            total REAL NOT NULL,
+            items TEXT NOT NULL
+        );
+        CREATE TABLE promotions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            active INTEGER DEFAULT 1,
+            created_at TEXT,
+            last_shown TEXT
+        );
+        CREATE TABLE ui_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    ''')
+    conn.executemany('INSERT INTO products (id, name, unit, price, stock, category, image, last_updated, discount) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(p['id'], p['name'], p['unit'], p['price'], p['stock'], p['category'], p['image'],
+                       '2025-01-01 09:00:00', p.get('discount', 0)) for p in db.DEFAULT_PRODUCTS.values()])
+    conn.executemany('INSERT INTO cart (product_id, qty) VALUES (?, ?)', [(MILK, 2), (TEA, 1)])
+    conn.executemany('INSERT INTO sales (timestamp, total, items) VALUES (?, ?, ?)',
+                     [(ts, sum(i['final_price'] * i['qty'] for i in items), json.dumps(items)) for ts, items in SALES])
+    conn.executemany('INSERT INTO ui_settings (key, value) VALUES (?, ?)',
+                     [('app_name', 'Smart Trolley'), ('frozen_products', json.dumps([SUGAR]))])
+    conn.commit()
+    conn.close()
+
+def test_migrates_to_current_schema():
+    print("Migrating a database in the original format...")
+    db.init_db()
+    with db.connection() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version == len(db.MIGRATIONS):
+        print(f"✅ Schema at version {version}.")
+    else:
+        print(f"❌ Schema at version {version}, expected {len(db.MIGRATIONS)}.")
+
+def test_cart_preserved():
+    print("Checking the shared cart moved to the default trolley...")
+    expected = {MILK: 2, TEA: 1}
+    cart = {pid: item['qty'] for pid, item in db.get_cart_items(config.DEFAULT_TROLLEY_ID).items()}
+    if cart == expected:
+        print("✅ Cart preserved.")
+    else:
+        print(f"❌ Cart is {cart}, expected {expected}.")
+
+def test_frozen_preserved():
+    print("Checking frozen products moved out of ui_settings...")
+    settings = db.get_ui_settings()
+    if db.is_frozen(SUGAR) and not db.is_frozen(MILK) and 'frozen_products' not in settings:
+        print("✅ Frozen product preserved.")
+    else:
+        print("❌ Frozen products were not carried over.")
+
+def test_sale_items_preserved():
+    print("Checking sale lines were backfilled from the items JSON...")
+    sales = db.get_sales_history()
+    got = [(s['timestamp'], [(i['id'], i['qty'], i['final_price']) for i in s['items']]) for s in sales]
+    expected = [(ts, [(i['id'], i['qty'], i['final_price']) for i in items]) for ts, items in SALES]
+    if got == expected:
+        print(f"✅ {len(sales)} sales with their lines preserved.")
+    else:
+        print(f"❌ Got {got}, expected {expected}.")
+
+    print("Checking the migrated sales reach the analytics rollups...")
+    top = {p['id']: p['quantity'] for p in db.get_top_products(limit=10)}
+    if top.get(SUGAR) == 3 and top.get(MILK) == 2:
+        print("✅ Rollups include the migrated sales.")
+    else:
+        print(f"❌ Top products are {top}.")
+
+def test_rerun_is_noop():
+    print("Running init_db again...")
+    before = db.get_sales_history()
+    db.init_db()
+    if db.get_sales_history() == before:
+        print("✅ Second run changed nothing.")
+    else:
+        print("❌ Second run changed the sales.")
+
+if __name__ == "__main__":
+    build_original_db(config.DB_FILE)
+    test_migrates_to_current_schema()
+    test_cart_preserved()
+    test_frozen_preserved()
+    test_sale_items_preserved()
+    test_rerun_is_noop()
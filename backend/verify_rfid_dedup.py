@@ -0,0 +1,124 @@
+import os
+import tempfile
+
+# Checks the duplicate-read filter on its own and through /rfid, and that a
+# re-sent /rfid/batch is applied once. Runs the app in-process against a
+# throwaway database unless DB_FILE is set.
+#   python verify_rfid_dedup.py
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "verify_rfid_dedup.db"))
+os.environ.setdefault("DISABLE_AUDIT_LOG", "1")
+
+import db
+from app import app
+from rfid_dedup import BatchLog, ScanDeduplicator
+
+WINDOW = 2.0
+
+def test_back_dated_batch():
+    dedup = ScanDeduplicator(WINDOW)
+    now = 1000.0
+
+    # A /rfid/batch places its scans before the newest one: tag A read 1.5 s
+    # before the batch arrived, after tag B was seen "now"
+    print("Scanning B, then a batch with A back-dated by 1.5 s...")
+    dedup.accept("T01", "B", now)
+    if dedup.accept("T01", "A", now - 1.5):
+        print("✅ First read of A accepted.")
+    else:
+        print("❌ First read of A was dropped.")
+
+    # 3.1 s after A's sighting its window has passed, even though B (still
+    # inside its own window) was recorded before it
+    print("Re-scanning A 3.1 s after it was first seen...")
+    if dedup.accept("T01", "A", now + 1.6):
+        print("✅ Re-scan after the window accepted.")
+    else:
+        print("❌ Re-scan after the window was dropped as a duplicate.")
+
+    print("Re-scanning A again within the window...")
+    if not dedup.accept("T01", "A", now + 2.1):
+        print("✅ Repeat read inside the window dropped.")
+    else:
+        print("❌ Repeat read inside the window was accepted.")
+
+    print("Checking expired sightings are released...")
+    dedup.accept("T02", "C", now + 10)
+    tracked = dedup.stats()['tracked']
+    if tracked == 1:
+        print("✅ Only the live sighting is tracked.")
+    else:
+        print(f"❌ {tracked} sightings tracked, expected 1.")
+
+def test_manual_adds_not_filtered():
+    client = app.test_client()
+    uid = "03563B38"
+    db.clear_cart("VERIFY-KIOSK")
+    db.clear_cart("VERIFY-READER")
+
+    # Kiosk "+" taps post /rfid without a source: every tap is an add
+    print("Tapping + three times in a row...")
+    for _ in range(3):
+        client.post("/rfid", json={"uid": uid, "trolley_id": "VERIFY-KIOSK"})
+    qty = db.get_cart_items("VERIFY-KIOSK").get(uid, {}).get("qty", 0)
+    if qty == 3:
+        print("✅ All three manual adds counted.")
+    else:
+        print(f"❌ Cart holds {qty}, expected 3.")
+
+    print("Reading the same tag twice from the reader...")
+    for _ in range(2):
+        res = client.post("/rfid", json={"uid": uid, "trolley_id": "VERIFY-READER", "source": "reader"})
+    qty = db.get_cart_items("VERIFY-READER").get(uid, {}).get("qty", 0)
+    if qty == 1 and res.get_json().get("duplicate"):
+        print("✅ Repeat reader read ignored.")
+    else:
+        print(f"❌ Cart holds {qty}, expected 1.")
+
+    print("Scanning an unknown tag twice from the reader...")
+    codes = [client.post("/rfid", json={"uid": "NO-SUCH-TAG", "trolley_id": "VERIFY-READER", "source": "reader"}).status_code
+             for _ in range(2)]
+    if codes == [404, 404]:
+        print("✅ Unknown tag rejected both times.")
+    else:
+        print(f"❌ Got {codes}, expected [404, 404].")
+
+def test_resent_batch_applied_once():
+    client = app.test_client()
+    trolley_id = "VERIFY-BATCH"
+    db.clear_cart(trolley_id)
+    batch = {"trolley_id": trolley_id, "batch_id": "a1b2-1", "scans": [{"uid": "03563B38", "ts": 1000}]}
+
+    # The reader re-sends a batch whose reply it never got
+    print("Sending the same batch twice...")
+    client.post("/rfid/batch", json=batch)
+    res = client.post("/rfid/batch", json=batch)
+    qty = db.get_cart_items(trolley_id).get("03563B38", {}).get("qty", 0)
+    resent = res.status_code == 200 and res.get_json().get("resent")
+    if qty == 1 and resent:
+        print("✅ Re-sent batch acknowledged without adding it again.")
+    else:
+        print(f"❌ Cart holds {qty} (expected 1), re-send {'recognised' if resent else 'not recognised'}.")
+
+    print("Sending the next batch...")
+    client.post("/rfid/batch", json=dict(batch, batch_id="a1b2-2", scans=[{"uid": "435D1D39", "ts": 3000}]))
+    if "435D1D39" in db.get_cart_items(trolley_id):
+        print("✅ New batch ID applied.")
+    else:
+        print("❌ New batch ID was ignored.")
+
+    print("Re-claiming a batch that failed to apply...")
+    log = BatchLog()
+    log.claim(trolley_id, "x-1")
+    pending = log.claim(trolley_id, "x-1")
+    log.finish(trolley_id, "x-1", applied=False)
+    if pending == "pending" and log.claim(trolley_id, "x-1") == "new":
+        print("✅ Failed batch can be applied on retry.")
+    else:
+        print("❌ Failed batch was remembered as applied.")
+
+if __name__ == "__main__":
+    db.init_db()
+    test_back_dated_batch()
+    test_manual_adds_not_filtered()
+    test_resent_batch_applied_once()
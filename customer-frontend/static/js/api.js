@@ -1,22 +1,35 @@
 const API_BASE_URL = '';
 
+// Each kiosk belongs to one trolley. Open the kiosk as /?trolley_id=T02 once;
+// the ID is remembered on this device. Defaults to the firmware's 'T01'.
+const TROLLEY_ID = (() => {
+    const fromUrl = new URLSearchParams(window.location.search).get('trolley_id');
+    if (fromUrl) localStorage.setItem('trolley_id', fromUrl);
+    return fromUrl || localStorage.getItem('trolley_id') || 'T01';
+})();
+
 async function fetchProducts() {
     const response = await fetch(`${API_BASE_URL}/products`);
     return await response.json();
 }
 
 async function fetchCart() {
-    const response = await fetch(`${API_BASE_URL}/cart`);
+    const response = await fetch(`${API_BASE_URL}/cart?trolley_id=${encodeURIComponent(TROLLEY_ID)}`);
     return await response.json();
 }
 
+// Server-Sent Events: "cart" and "promotion" events for this trolley
+function openCartStream() {
+    return new EventSource(`${API_BASE_URL}/cart/stream?trolley_id=${encodeURIComponent(TROLLEY_ID)}`);
+}
+
 async function scanItem(uid) {
     const response = await fetch(`${API_BASE_URL}/rfid`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ uid }),
+        body: JSON.stringify({ uid, trolley_id: TROLLEY_ID }),
     });
     return await response.json();
 }
@@ -27,7 +40,7 @@ async function removeItem(uid) {
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ uid }),
+        body: JSON.stringify({ uid, trolley_id: TROLLEY_ID }),
     });
     return await response.json();
 }
@@ -38,7 +51,7 @@ async function checkout(discountPercent = 0) {
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ discount: discountPercent })
+        body: JSON.stringify({ discount: discountPercent, trolley_id: TROLLEY_ID })
     });
     return await response.json();
 }
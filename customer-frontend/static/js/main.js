@@ -10,14 +10,14 @@ async function init() {
     await loadProducts();
     await refreshCart();
 
-    // 2. Setup Real-time Polling
-    setInterval(refreshCart, 2000); // Poll cart every 2s
+    // 2. Real-time updates: server push, polling only while the stream is down
+    connectCartStream();
     updateClock();
     setInterval(updateClock, 1000); // Update time every second
 
-    // Initial Promo Check & Interval
+    // Initial Promo Check; re-apply the latest promo if a modal blocked it
     checkPromo();
-    setInterval(checkPromo, 5000); // Poll promo every 5s
+    setInterval(() => { if (latestPromo) applyPromo(latestPromo); }, 5000);
 
     // 3. Setup UI Interactions
     setupCategories();
@@ -27,12 +27,56 @@ async function init() {
 
 let lastPromoId = null;
 let spinWheelShownThisSession = false;
+let latestPromo = null;
+let pollTimers = [];
+
+function startPolling() {
+    if (pollTimers.length) return;
+    console.log("[SYNC] Cart stream unavailable, polling");
+    pollTimers = [
+        setInterval(refreshCart, 2000), // Poll cart every 2s
+        setInterval(checkPromo, 5000)   // Poll promo every 5s
+    ];
+}
+
+function stopPolling() {
+    pollTimers.forEach(clearInterval);
+    pollTimers = [];
+}
+
+function connectCartStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const stream = openCartStream();
+    stream.addEventListener('cart', (e) => {
+        if (!checkoutInProgress) renderCart(JSON.parse(e.data));
+    });
+    stream.addEventListener('promotion', (e) => {
+        latestPromo = JSON.parse(e.data);
+        applyPromo(latestPromo);
+    });
+    // EventSource reconnects by itself; poll in the meantime
+    stream.onopen = () => {
+        stopPolling();
+        refreshCart(); // catch up on changes missed while disconnected
+    };
+    stream.onerror = startPolling;
+}
 
 async function checkPromo() {
     try {
         const response = await fetch('/api/promotions/current');
-        const data = await response.json(); // Now returns { spin_wheel: ..., banner: ... }
+        latestPromo = await response.json(); // Now returns { spin_wheel: ..., banner: ... }
+        applyPromo(latestPromo);
+    } catch (e) {
+        console.error("Promo Check Failed:", e);
+    }
+}
 
+function applyPromo(data) {
+    try {
         // 1. Check Spin Wheel (Highest Priority, show once per page load)
         if (data.spin_wheel && !spinWheelShownThisSession) {
             console.log("[SPIN WHEEL] Found active spin wheel promotion");
@@ -59,7 +103,7 @@ async function checkPromo() {
             }
         }
     } catch (e) {
-        console.error("Promo Check Failed:", e);
+        console.error("Promo Apply Failed:", e);
     }
 }
 
@@ -641,7 +685,8 @@ async function processPayment() {
     await new Promise(r => setTimeout(r, 2000)); // Simulate delay
 
     try {
-        await checkout(currentDiscountPercent); // Call backend with discount
+        const result = await checkout(currentDiscountPercent); // Call backend with discount
+        if (result.status !== 'ok') throw new Error(result.message); // e.g. scans still saving: retry
         localStorage.removeItem('spin_discount'); // Clear used discount
         closePaymentModal();
         openModal('success-modal'); // Reusing generic helper
@@ -15,12 +15,39 @@ const char* password = "12345678";
 
 /* ================== SERVER ================== */
 // AUTOMATIC IP UPDATE: Using the Pi's detected IP address
-const String serverUrl = "http://10.128.199.147:5000/rfid";
+const String serverUrl = "http://10.128.199.147:5000/rfid/batch";
+const String trolleyId = "T01";
 
 /* ================== ANTI DUPLICATE ================== */
 unsigned long lastReadTime = 0;
 const unsigned long cooldown = 800;   // milliseconds
 
+/* ================== SCAN BATCHING ================== */
+// Tags read close together (items dropped in one go) are sent in one request.
+// The batch is sent once no new tag has been read for batchWindow ms, or
+// as soon as it is full.
+const unsigned long batchWindow = 1000; // milliseconds, must exceed cooldown
+const int maxBatch = 10;
+
+String batchUids[maxBatch];
+unsigned long batchTimes[maxBatch];
+int batchCount = 0;
+
+// A sent batch stays queued until the Pi answers: 2xx delivers it and 4xx
+// (a request the Pi will never accept) drops it, while transport errors and
+// 5xx are retried every retryDelay ms. A retry re-sends the same scans under
+// the same batch ID, so the Pi can skip a batch it already applied when only
+// the reply was lost; scans read meanwhile wait for the next batch. Scans
+// read while the queue is full are dropped.
+const unsigned long retryDelay = 2000; // milliseconds
+unsigned long lastSendAttempt = 0;
+bool lastSendFailed = false;
+unsigned long droppedScans = 0;
+
+String bootId;               // random per boot, so batch IDs never repeat after a restart
+unsigned long batchSeq = 0;
+int inFlight = 0;            // scans at the front of the queue sent under batch bootId-batchSeq
+
 /* ================== SETUP ================== */
 void setup() {
 
@@ -34,6 +61,8 @@ void setup() {
 
   Serial.println("RFID Ready");
 
+  bootId = String(ESP.random(), HEX);
+
   /* WiFi Init */
   WiFi.mode(WIFI_STA);
   WiFi.begin(ssid, password);
@@ -65,6 +94,12 @@ void loop() {
     return;
   }
 
+  /* Send pending scans once the scan window has closed */
+  if (batchCount > 0 && millis() - lastReadTime >= batchWindow &&
+      (!lastSendFailed || millis() - lastSendAttempt >= retryDelay)) {
+    sendBatchToPi();
+  }
+
   /* Check for RFID card */
   if (!mfrc522.PICC_IsNewCardPresent()) return;
   if (!mfrc522.PICC_ReadCardSerial()) return;
@@ -95,8 +130,23 @@ void loop() {
   Serial.print("Card Detected: ");
   Serial.println(uid);
 
-  /* Send UID to Pi */
-  sendToPi(uid);
+  /* Queue UID for the next batch (a batch that failed to send is kept for retry) */
+  if (batchCount < maxBatch) {
+    batchUids[batchCount] = uid;
+    batchTimes[batchCount] = now;
+    batchCount++;
+  } else {
+    droppedScans++;
+    Serial.print("Batch full, scan dropped: ");
+    Serial.print(uid);
+    Serial.print(" (dropped so far: ");
+    Serial.print(droppedScans);
+    Serial.println(")");
+  }
+
+  if (batchCount == maxBatch && (!lastSendFailed || now - lastSendAttempt >= retryDelay)) {
+    sendBatchToPi();
+  }
 
   /* Reset RFID */
   mfrc522.PICC_HaltA();
@@ -106,11 +156,14 @@ void loop() {
 }
 
 /* ================== SEND FUNCTION ================== */
-void sendToPi(String uid) {
+void sendBatchToPi() {
 
   WiFiClient client;
   HTTPClient http;
 
+  lastSendAttempt = millis();
+  lastSendFailed = true;
+
   if (!http.begin(client, serverUrl)) {
     Serial.println("HTTP Begin Failed");
     return;
@@ -118,8 +171,20 @@ void sendToPi(String uid) {
 
   http.addHeader("Content-Type", "application/json");
 
-  String payload =
-    "{\"uid\":\"" + uid + "\",\"trolley_id\":\"T01\"}";
+  /* A new batch takes everything queued; a retry re-sends the same scans */
+  if (inFlight == 0) {
+    inFlight = batchCount;
+    batchSeq++;
+  }
+
+  String payload = "{\"trolley_id\":\"" + trolleyId + "\",\"batch_id\":\"" + bootId + "-" + String(batchSeq) + "\",\"scans\":[";
+
+  for (int i = 0; i < inFlight; i++) {
+    if (i > 0) payload += ",";
+    payload += "{\"uid\":\"" + batchUids[i] + "\",\"ts\":" + String(batchTimes[i]) + "}";
+  }
+
+  payload += "]}";
 
   int httpCode = http.POST(payload);
 
@@ -133,6 +198,15 @@ void sendToPi(String uid) {
     Serial.print("Server Reply: ");
     Serial.println(response);
 
+    if (httpCode >= 200 && httpCode < 300) {
+      dropSentScans();   // delivered
+      lastSendFailed = false;
+    } else if (httpCode >= 400 && httpCode < 500) {
+      Serial.println("Batch rejected, not retrying");
+      dropSentScans();   // the Pi will never accept it; 5xx keeps it for retry
+      lastSendFailed = false;
+    }
+
   } else {
 
     Serial.println("HTTP Send Failed");
@@ -140,3 +214,15 @@ void sendToPi(String uid) {
 
   http.end();
 }
+
+/* Remove the scans of the answered batch, keeping any read since it was sent */
+void dropSentScans() {
+
+  for (int i = inFlight; i < batchCount; i++) {
+    batchUids[i - inFlight] = batchUids[i];
+    batchTimes[i - inFlight] = batchTimes[i];
+  }
+
+  batchCount -= inFlight;
+  inFlight = 0;
+}